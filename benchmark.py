@@ -0,0 +1,340 @@
+"""Benchmarks for the hot paths of YT-DLP GUI, written as JSON so results can be compared across commits.
+Fixtures are generated deterministically (or loaded from `yt-dlp -J` output with --info-json) and downloads go to a
+local HTTP server, so no network access is needed and runs are reproducible.
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json --compare before.json"""
+import argparse
+import functools
+import http.server
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable
+
+import engine
+from engine import Engine, FormatTable, Task, build_ydl_opts, parse_format, parse_info
+
+
+def make_video_info(num_formats: int = 200, seed: int = 0) -> dict:
+    """Info dict shaped like a YouTube extraction with many video only, audio only and muxed formats"""
+    rng = random.Random(seed)
+    formats = [{'format_id': 'sb0', 'format_note': 'storyboard', 'ext': 'mhtml', 'vcodec': 'none', 'acodec': 'none', 'url': 'https://example.invalid/sb'}]
+    for i in range(num_formats):
+        height = rng.choice((144, 240, 360, 480, 720, 1080, 1440, 2160))
+        f = {'format_id': str(100 + i), 'ext': rng.choice(('mp4', 'webm', 'm4a')), 'url': f'https://example.invalid/{i}',
+             'filesize': rng.randint(10 ** 5, 10 ** 9), 'format_note': f'{height}p', 'vcodec': 'none', 'acodec': 'none'}
+        if i % 3 != 1:
+            f.update(vcodec=rng.choice(('avc1.640028', 'vp09.00.51.08', 'av01.0.08M.08')), resolution=f'{height * 16 // 9}x{height}',
+                     fps=rng.choice((24, 30, 60)), dynamic_range=rng.choice(('SDR', 'HDR10')))
+        if i % 3 != 0:
+            f.update(acodec=rng.choice(('mp4a.40.2', 'opus')), asr=rng.choice((44100, 48000)), abr=rng.choice((48, 128, 160)))
+        formats.append(f)
+    return {'id': f'bench{seed:06d}', 'title': f'Benchmark video {seed}', 'duration_string': '10:00', 'filesize_approx': 123456789,
+            'formats': formats, 'requested_formats': [formats[1], formats[2]], 'subtitles': {}}
+
+
+def make_flat_playlist(num_entries: int = 10000, seed: int = 0) -> dict:
+    """Flat playlist (extract_flat='in_playlist') with num_entries YouTube style entries"""
+    rng = random.Random(seed)
+    return {'_type': 'playlist', 'id': 'PLbench', 'title': f'Benchmark playlist ({num_entries} videos)',
+            'webpage_url': 'https://www.youtube.com/playlist?list=PLbench',
+            'entries': [{'_type': 'url', 'ie_key': 'Youtube', 'id': f'{i:011d}', 'url': f'https://www.youtube.com/watch?v={i:011d}',
+                         'title': f'Video {i} ' + ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz ', k=40)), 'duration': rng.randint(30, 7200)}
+                        for i in range(num_entries)]}
+
+
+def measure(func: Callable, number: int, repeat: int = 5) -> float:
+    """Best time per call in seconds over repeat runs of number calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best
+
+
+def bench_parsing(infos: list[dict]) -> dict:
+    formats = [f for info in infos for f in info.get('formats', []) if f.get('format_id')]
+    per_format = measure(lambda: [parse_format(f) for f in formats], number=20) / len(formats)
+    per_info_all = measure(lambda: [parse_info(info, best_format_only=False) for info in infos], number=20) / len(infos)
+    per_info_best = measure(lambda: [parse_info(info) for info in infos], number=200) / len(infos)
+    per_table = measure(lambda: [FormatTable(info) for info in infos], number=20) / len(infos)
+    tables = [FormatTable(info) for info in infos]
+    per_best = measure(lambda: [table.best(1080, max_size=100 * 1024 * 1024) for table in tables], number=200) / len(infos)
+    return {'parse_format_per_s': round(1 / per_format), 'parse_info_all_formats_ms': round(per_info_all * 1000, 3),
+            'format_table_ms': round(per_table * 1000, 3), 'format_table_best_us': round(per_best * 1e6, 2),
+            'parse_info_best_format_us': round(per_info_best * 1e6, 2), 'formats_per_info': round(len(formats) / len(infos))}
+
+
+def bench_progress_hook() -> dict:
+    task = Task('https://example.invalid/video', tempfile.gettempdir(), build_ydl_opts(tempfile.gettempdir()), check_archive=False)
+    counter = iter(range(10 ** 9))
+
+    def callback():
+        downloaded = next(counter) * 65536
+        task.progress_hook({'status': 'downloading', 'filename': 'bench.mp4', 'downloaded_bytes': downloaded, 'total_bytes': 10 ** 12,
+                            'speed': 1e7, 'eta': 100})
+
+    return {'progress_hook_us': round(measure(callback, number=100000) * 1e6, 3)}
+
+
+def bench_dispatch(queue_sizes: tuple) -> dict:
+    """Cost of Engine.poll(), which do_tasks runs every 500 ms, with queues where every waiting task has to be scanned"""
+    results = {}
+    for size in queue_sizes:
+        download_engine = Engine(max_downloads=3, max_per_host=2)
+        download_engine.prefetch_ahead = 0
+        summary = {'title': 'Queued', 'duration_string': '1:00', 'filesize': 1, 'formats': {'video': None, 'audio': None}}
+        with engine.queue_store.batch():
+            tasks = [Task('https://example.invalid/video', tempfile.gettempdir(), build_ydl_opts(tempfile.gettempdir()), summary, check_archive=False)
+                     for _ in range(size)]
+        for task in tasks[:2]:  # occupy the host, so the rest are scanned and skipped by the per-host cap
+            task.active = True
+        t0 = time.perf_counter()
+        for task in tasks:
+            download_engine.add(task)
+        results[f'enqueue_{size}_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        results[f'poll_{size}_ms'] = round(measure(download_engine.poll, number=10) * 1000, 3)
+    return results
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class RateLimitedHandler(QuietHandler):
+    """Answers the first server.limited requests with HTTP 429, like a site rate limiting a batch"""
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            limited = self.server.requests <= self.server.limited
+        if limited:
+            self.send_response(429, 'Too Many Requests')
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            super().do_GET()
+
+
+class SlowSegmentHandler(QuietHandler):
+    """Delays every HLS segment by server.latency seconds, like a CDN with a long round trip, so fetching fragments in parallel pays off"""
+    def do_GET(self):
+        if self.path.endswith('.ts'): time.sleep(self.server.latency)
+        super().do_GET()
+
+
+class QuietServer(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):  # the extractor drops its probe connection early, that is expected
+        pass
+
+
+def bench_end_to_end(work_dir: str, size_mib: int, num_tasks: int) -> dict:
+    """Download num_tasks files of size_mib from a local HTTP server with the engine's scheduler"""
+    serve_dir, out_dir = os.path.join(work_dir, 'serve'), os.path.join(work_dir, 'out')
+    os.makedirs(serve_dir)
+    block = os.urandom(1024 * 1024)
+    for i in range(num_tasks):
+        with open(os.path.join(serve_dir, f'file{i}.mp4'), 'wb') as f:
+            for _ in range(size_mib):
+                f.write(block)
+    server = QuietServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=serve_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        download_engine = Engine(max_downloads=num_tasks, max_per_host=num_tasks)
+        for i in range(num_tasks):
+            ydl_opts = build_ydl_opts(out_dir)
+            ydl_opts['noprogress'] = True
+            download_engine.add(Task(f'http://127.0.0.1:{server.server_port}/file{i}.mp4', out_dir, ydl_opts, check_archive=False))
+        t0 = time.perf_counter()
+        download_engine.run_until_complete(poll_interval=0.05)
+        elapsed = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+    return {'e2e_mib_per_s': round(size_mib * num_tasks / elapsed, 1), 'e2e_seconds': round(elapsed, 2),
+            'e2e_failed': download_engine.failed, 'e2e_tasks': num_tasks, 'e2e_file_mib': size_mib}
+
+
+def bench_bandwidth(work_dir: str, global_limit: int, task_limit: int, num_tasks: int = 3, seconds: float = 3) -> dict:
+    """Download from a local server (much faster than the caps) under a global limit shared by num_tasks downloads, then with
+    a per-task limit each, and report the measured throughput against each cap. Files are sized to take about `seconds`."""
+    serve_dir = os.path.join(work_dir, 'bandwidth')
+    os.makedirs(serve_dir)
+    server = QuietServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=serve_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = {'bandwidth_global_limit': global_limit, 'bandwidth_task_limit': task_limit}
+    try:
+        for name, file_size in (('global', int(global_limit * seconds / num_tasks)), ('task', int(task_limit * seconds))):
+            with open(os.path.join(serve_dir, f'{name}.mp4'), 'wb') as f:
+                f.write(os.urandom(file_size))
+            out_dir = os.path.join(work_dir, f'bandwidth_{name}')
+            download_engine = Engine(max_downloads=num_tasks, max_per_host=num_tasks)
+            download_engine.bandwidth.limit = global_limit if name == 'global' else None
+            tasks = []
+            for i in range(num_tasks):
+                ydl_opts = build_ydl_opts(out_dir)
+                ydl_opts.update(noprogress=True, outtmpl=os.path.join(out_dir, f'{i}.%(ext)s'))
+                task = download_engine.add(Task(f'http://127.0.0.1:{server.server_port}/{name}.mp4?{i}', out_dir, ydl_opts, check_archive=False))
+                task.rate_limit = task_limit if name == 'task' else None
+                tasks.append(task)
+            download_engine.run_until_complete(poll_interval=0.05)
+            if name == 'global':  # all downloads together, from the first start to the last finish (extraction left out)
+                elapsed = max(t.download_finished_at for t in tasks) - min(t.started_at for t in tasks)
+                results['bandwidth_global_bytes_per_s'] = round(file_size * num_tasks / elapsed)
+                results['bandwidth_global_ratio'] = round(file_size * num_tasks / elapsed / global_limit, 2)
+            else:  # fastest single download
+                fastest = max(row['avg_bytes_per_s'] or 0 for row in download_engine.history)
+                results['bandwidth_task_max_bytes_per_s'] = fastest
+                results['bandwidth_task_ratio'] = round(fastest / task_limit, 2)
+            results[f'bandwidth_{name}_failed'] = download_engine.failed
+    finally:
+        server.shutdown()
+    return results
+
+
+def bench_hls(work_dir: str, num_segments: int, latency: float = 0.05) -> dict:
+    """Download a fake HLS stream (manifest and num_segments segments, each delayed by latency) from a local server
+    with the Standard profile and with parallel fragments, through yt-dlp's native HLS downloader"""
+    serve_dir = os.path.join(work_dir, 'hls')
+    os.makedirs(serve_dir)
+    segment = bytes([0x47]) + os.urandom(188 * 1024 - 1)  # content is not parsed, only fetched and joined
+    with open(os.path.join(serve_dir, 'stream.m3u8'), 'w', encoding='utf-8') as f:
+        f.write('#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:2\n#EXT-X-MEDIA-SEQUENCE:0\n')
+        for i in range(num_segments):
+            f.write(f'#EXTINF:2.0,\nseg{i}.ts\n')
+            with open(os.path.join(serve_dir, f'seg{i}.ts'), 'wb') as seg:
+                seg.write(segment)
+        f.write('#EXT-X-ENDLIST\n')
+    server = QuietServer(('127.0.0.1', 0), functools.partial(SlowSegmentHandler, directory=serve_dir))
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = {'hls_segments': num_segments, 'hls_segment_latency_ms': round(latency * 1000)}
+    try:
+        for name, profile in (('standard', 'Standard'), ('parallel', 'Parallel fragments')):
+            out_dir = os.path.join(work_dir, f'hls_{name}')
+            ydl_opts = build_ydl_opts(out_dir)
+            engine.apply_performance_profile(ydl_opts, profile)
+            ydl_opts['noprogress'] = True
+            download_engine = Engine()
+            download_engine.add(Task(f'http://127.0.0.1:{server.server_port}/stream.m3u8', out_dir, ydl_opts, check_archive=False))
+            t0 = time.perf_counter()
+            download_engine.run_until_complete(poll_interval=0.05)
+            results[f'hls_{name}_seconds'] = round(time.perf_counter() - t0, 2)
+            results[f'hls_{name}_failed'] = download_engine.failed
+            results[f'hls_{name}_bytes'] = sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir)) if os.path.isdir(out_dir) else 0
+    finally:
+        server.shutdown()
+    results['hls_parallel_speedup'] = round(results['hls_standard_seconds'] / max(results['hls_parallel_seconds'], 0.001), 2)
+    return results
+
+
+def bench_rate_limited(work_dir: str, num_tasks: int, limited: int) -> dict:
+    """Queue num_tasks downloads from a local server that answers the first `limited` requests with HTTP 429.
+    All of them should finish, after the host is backed off instead of failing one after another."""
+    serve_dir, out_dir = os.path.join(work_dir, 'serve429'), os.path.join(work_dir, 'out429')
+    os.makedirs(serve_dir)
+    for i in range(num_tasks):
+        with open(os.path.join(serve_dir, f'file{i}.mp4'), 'wb') as f:
+            f.write(os.urandom(256 * 1024))
+    server = QuietServer(('127.0.0.1', 0), functools.partial(RateLimitedHandler, directory=serve_dir))
+    server.lock, server.requests, server.limited = threading.Lock(), 0, limited
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        download_engine = Engine(max_downloads=num_tasks, max_per_host=num_tasks)
+        download_engine.hosts.base_delays = dict.fromkeys(download_engine.hosts.base_delays, 0.5)  # seconds instead of minutes
+        tasks = []
+        for i in range(num_tasks):
+            ydl_opts = build_ydl_opts(out_dir)
+            ydl_opts['noprogress'] = True
+            tasks.append(download_engine.add(Task(f'http://127.0.0.1:{server.server_port}/file{i}.mp4', out_dir, ydl_opts, check_archive=False)))
+        t0 = time.perf_counter()
+        download_engine.run_until_complete(poll_interval=0.05)
+        elapsed = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+    return {'rate_limited_finished': download_engine.finished, 'rate_limited_failed': download_engine.failed,
+            'rate_limited_requeues': sum(task.attempts for task in tasks), 'rate_limited_seconds': round(elapsed, 2)}
+
+
+def bench_selector(num_entries: int) -> dict:
+    """Build time of the playlist selector, measured by the GUI itself since it needs a display"""
+    gui = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yt-dlp-gui.py')
+    try:
+        result = subprocess.run([sys.executable, gui, '--selector-benchmark', str(num_entries)], capture_output=True, text=True, timeout=300)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    except (subprocess.SubprocessError, IndexError, ValueError):
+        return {'selector_skipped': 'GUI could not run (no display?)'}
+
+
+def compare(old: dict, new: dict):
+    """Print the change of every numeric metric present in both result files"""
+    for key, value in new['results'].items():
+        previous = old['results'].get(key)
+        if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+            print(f'{key:32} {previous:>12} -> {value:>12} ({(value - previous) / previous * 100:+.1f}%)')
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark YT-DLP GUI hot paths and write the results as JSON.')
+    parser.add_argument('-o', '--output', help='write results to this JSON file instead of stdout')
+    parser.add_argument('--compare', help='results JSON of a previous run to compare against')
+    parser.add_argument('--info-json', action='append', default=[], help='recorded info dict (yt-dlp -J output) to benchmark parsing with, repeatable')
+    parser.add_argument('--playlist-size', type=int, default=10000, help='entries of the synthetic flat playlist')
+    parser.add_argument('--e2e-size', type=int, default=64, help='MiB per file downloaded in the end-to-end benchmark, 0 to skip')
+    parser.add_argument('--e2e-tasks', type=int, default=4, help='number of concurrent downloads in the end-to-end benchmark')
+    parser.add_argument('--no-gui', action='store_true', help='skip the playlist selector benchmark')
+    parser.add_argument('--bandwidth', default='4M,1M', help='global and per-task limit of the bandwidth benchmark, e.g. 4M,1M, empty to skip')
+    parser.add_argument('--hls-segments', type=int, default=40, help='segments of the fake HLS stream in the fragment download benchmark, 0 to skip')
+    parser.add_argument('--rate-limited', type=int, default=3, help='requests answered with HTTP 429 in the rate limit benchmark, 0 to skip')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # keep the user's queue, archive and metadata cache out of it
+        engine.queue_store = engine.QueueStore(os.path.join(work_dir, 'queue.sqlite3'))
+        engine.download_archive = engine.DownloadArchive(os.path.join(work_dir, 'archive.sqlite3'))
+        engine.metadata_cache = engine.MetadataCache(os.path.join(work_dir, 'cache'), engine.METADATA_CACHE_MAX_BYTES)
+        engine.load_yt_dlp()
+        infos = []
+        for path in args.info_json:
+            with open(path, encoding='utf-8') as f:
+                infos.append(json.load(f))
+        results = bench_parsing(infos or [make_video_info(seed=seed) for seed in range(20)])
+        results.update(bench_progress_hook())
+        results.update(bench_dispatch((1000, 10000)))
+        if args.e2e_size > 0:
+            results.update(bench_end_to_end(work_dir, args.e2e_size, args.e2e_tasks))
+        if args.bandwidth:
+            global_limit, task_limit = (engine.parse_rate(rate) for rate in args.bandwidth.split(','))
+            results.update(bench_bandwidth(work_dir, global_limit, task_limit))
+        if args.hls_segments > 0:
+            results.update(bench_hls(work_dir, args.hls_segments))
+        if args.rate_limited > 0:
+            results.update(bench_rate_limited(work_dir, args.e2e_tasks, args.rate_limited))
+        if not args.no_gui:
+            results.update(bench_selector(args.playlist_size))
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    report = {'meta': {'commit': commit or None, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+                       'yt_dlp': engine.yt_dlp.version.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2059 @@
+"""Download engine of YT-DLP GUI: extraction, caching, scheduling and persistence without any Tk dependency.
+The GUI is one client of Engine; `python engine.py` (or `yt-dlp-gui --headless`) runs the same queue from the command line."""
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import functools
+import csv
+import gzip
+import hashlib
+import http.cookiejar
+import http.server
+import json
+import logging
+import math
+import os
+import queue
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Union
+
+from sanitize_filename import sanitize
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.addLevelName(15, 'STATUS')  # between debug 10 and info 20
+logger.setLevel(15)
+MAX_DOWNLOAD_WORKERS = 8  # upper bound of the download pool, concurrency settings are capped to this
+download_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS, thread_name_prefix='download')
+PREFETCH_AHEAD = 4  # how many queued tasks beyond the running ones get their info extracted in advance
+extraction_executor = concurrent.futures.ThreadPoolExecutor(max_workers=3, thread_name_prefix='extract')
+# Audio conversion runs one ffmpeg process per job, so a thread per core only waits on its process
+TRANSCODE_WORKERS = os.cpu_count() or 2
+transcode_executor = concurrent.futures.ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS, thread_name_prefix='transcode')
+# Placeholder files of Engine.preallocate are created, shrunk and removed in order on one thread, fallocate may write zeros
+disk_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='disk')
+TRANSCODE_BACKLOG = 2 * TRANSCODE_WORKERS  # downloads that need conversion are held back while this many conversions are pending
+yt_dlp = None  # imported on first use by load_yt_dlp(), importing it and its extractors takes a while
+_yt_dlp_lock = threading.Lock()
+
+
+def load_yt_dlp():
+    """Import yt_dlp (once) and return it. The GUI calls this on a background thread right after the window is shown."""
+    global yt_dlp
+    if yt_dlp is None:
+        with _yt_dlp_lock:
+            if yt_dlp is None:
+                import yt_dlp as module
+                module.extractor.gen_extractor_classes()  # builds the extractor registry that the first extraction would otherwise pay for
+                yt_dlp = module
+    return yt_dlp
+
+
+def format_bytes(num_bytes: Union[int, float, None]) -> str:
+    return load_yt_dlp().utils.format_bytes(num_bytes)
+
+
+def format_seconds(seconds: Union[int, float, None]) -> str:
+    return load_yt_dlp().utils.formatSeconds(seconds) if seconds is not None else 'N/A'
+
+
+def get_res_path(relative_path: str) -> str:
+    """ Get absolute path to resource, works for dev and for PyInstaller
+     Relative path will always get extracted into root!"""
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(__file__))
+    if os.path.exists(os.path.join(base_path, relative_path)):
+        return os.path.join(base_path, relative_path)
+    else:
+        raise FileNotFoundError(f'{os.path.join(base_path, relative_path)} is not found!')
+
+
+# Add deno to PATH
+try:
+    deno_exe = 'deno.exe' if sys.platform == 'win32' else 'deno'
+    deno_path = get_res_path(deno_exe)
+    os.environ["PATH"] += os.pathsep + os.path.dirname(deno_path)
+    logger.info(f'Found {deno_exe} at {deno_path}, added to PATH')
+except FileNotFoundError:
+    logger.warning('Deno not found! yt-dlp might fail on some sites.')
+
+ydl_base_opts: dict[str, Any] = {'outtmpl': '%(title)s.%(ext)s',
+                                 'restrictfilenames': True,
+                                 'nocheckcertificate': True,
+                                 'ignoreerrors': False,
+                                 'logtostderr': False,
+                                 'geo-bypass': True,
+                                 'quiet': True,
+                                 'no_warnings': True,
+                                 'default_search': 'auto',
+                                 'source_address': '0.0.0.0',
+                                 'windowsfilenames': True,
+                                 'overwrites': True,
+                                 'cachedir': False,
+                                 'age_limit': 100,
+                                 'noplaylist': False,
+                                 'live_from_start': True,
+                                 'no-video-multistreams': True,
+                                 'no-audio-multistreams': True,
+                                 'check_formats': 'selected',
+                                 'fixup': 'detect_or_warn',
+                                 'extractor_args': {'youtube': {'skip': ['dash', 'hls']}, },
+                                 'ffmpeg_location': get_res_path('ffmpeg.exe') if sys.platform == 'win32' else 'ffmpeg',
+                                 }
+DEFAULT_EXTRACTOR_ARGS = copy.deepcopy(ydl_base_opts['extractor_args'])
+# Download tuning presets. concurrent_fragment_downloads fetches DASH/HLS fragments in parallel,
+# http_chunk_size splits progressive downloads into range requests (avoids per-connection throttling).
+PERFORMANCE_PROFILES: dict[str, dict[str, Any]] = {
+    'Standard': {},
+    'Parallel fragments': {'concurrent_fragment_downloads': 4, 'http_chunk_size': 10 * 1024 * 1024, 'buffersize': 1024 * 1024},
+    'Aggressive (include DASH/HLS)': {'concurrent_fragment_downloads': 8, 'http_chunk_size': 10 * 1024 * 1024, 'buffersize': 1024 * 1024, 'extractor_args': {}},
+}
+INFO_REUSE_MAX_AGE = 30 * 60  # seconds an extracted info dict is reused before its media URLs are re-resolved
+FLAT_INFO_CACHE_TTL = 6 * 60 * 60  # playlist listings change slowly
+FULL_INFO_CACHE_TTL = INFO_REUSE_MAX_AGE  # format lists carry expiring media URLs
+METADATA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PLAYLIST_PAGE_SIZE = 100  # entries handed to the playlist selector at a time while enumerating
+PRIORITY_WEIGHTS = {'Low': 1, 'Normal': 2, 'High': 4}  # share of the bandwidth limit relative to other downloads
+METRICS_PORT = 9464  # local Prometheus endpoint, http://127.0.0.1:9464/metrics
+TELEMETRY_HISTORY = 1000  # finished tasks whose telemetry is kept for export
+# Task states and the transitions allowed between them, see Task.set_state. QUEUED -> POSTPROCESSING: restored with only the conversion left
+QUEUED, EXTRACTING, EXTRACTED, DOWNLOADING, POSTPROCESSING, FINISHED, FAILED = 'queued', 'extracting', 'extracted', 'downloading', 'postprocessing', 'finished', 'failed'
+TASK_TRANSITIONS = {QUEUED: (EXTRACTING, FINISHED, POSTPROCESSING), EXTRACTING: (EXTRACTED, FAILED, QUEUED), EXTRACTED: (DOWNLOADING, FINISHED),
+                    DOWNLOADING: (POSTPROCESSING, FINISHED, FAILED, QUEUED), POSTPROCESSING: (FINISHED, FAILED), FINISHED: (), FAILED: ()}
+# Errors that are worth retrying later, as reported by yt-dlp, and the first backoff of their host in seconds
+RETRYABLE_ERRORS = {'rate_limited': re.compile(r'HTTP Error 429|Too Many Requests|rate.?limit|confirm you.re not a bot', re.IGNORECASE),
+                    'forbidden': re.compile(r'HTTP Error 403'),  # usually an expired or badly deciphered media URL, extracted again
+                    'network': re.compile(r'Connection (reset|aborted|refused)|Remote end closed|timed out|Temporary failure in name resolution|'
+                                          r'IncompleteRead|Network is unreachable|EOF occurred', re.IGNORECASE)}
+BACKOFF_BASE = {'rate_limited': 30, 'forbidden': 5, 'network': 5}
+BACKOFF_MAX = 15 * 60
+MAX_TASK_ATTEMPTS = 5  # a task failing with retryable errors this often fails for good
+COOKIE_JAR_TTL = 60 * 60  # seconds browser cookies are used before the browser's cookie database is read again
+COOKIE_RELOAD_MIN_INTERVAL = 60  # an authentication error only reloads cookies that are older than this
+KEYRING_SERVICE = 'YT-DLP GUI'  # name the key of the saved cookies is stored under in the OS keyring
+AUTH_ERROR_PATTERN = re.compile(r'sign in|log ?in|private video|members|HTTP Error 40[13]', re.IGNORECASE)
+THROTTLED_BLOCK_SIZE = 64 * 1024  # fixed read size while rate limited, yt-dlp grows it up to 4 MiB otherwise and the limit gets bursty
+DISK_HEADROOM = 512 * 1024 * 1024  # free space admission control never hands out, the disk is not filled to the last byte
+DISK_OVERHEAD_FACTOR = 2  # merging formats or converting audio keeps the inputs on disk while the output is written
+RESERVE_FILE_PREFIX = '.yt-dlp-gui-reserve-'  # placeholder files holding the space of admitted downloads, see Engine.preallocate
+ARCHIVE_KEY_BATCH = 50  # archive keys resolved from URLs are handed to the control thread this many at a time
+RESERVE_SHRINK_STEP = 64 * 1024 * 1024  # placeholders are shrunk as the download writes, in steps of at least this
+
+
+def report_error(title: str, message: str):
+    """Surface an unexpected error to the user. Replaced by the GUI with a message box."""
+    logger.error(f'{title}: {message}')
+
+
+def handle_login_required(e: object, url: str, ydl_opts: dict, func: Callable[[str, dict, bool], Union[dict, bool]]) -> Union[dict, bool]:
+    """Called when download() or extract_info() fails with a DownloadError, e.g. for private videos.
+    Returns the result of retrying func after logging in, or False. Replaced by the GUI with a browser cookie prompt."""
+    logger.error(f'{url}: {e}')
+    return False
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache keys: lowercase host without www./m., sorted query without tracking params"""
+    parsed = urllib.parse.urlparse(url.strip())
+    netloc = parsed.netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if netloc.startswith(prefix):
+            netloc = netloc[len(prefix):]
+    query = sorted((k, v) for k, v in urllib.parse.parse_qsl(parsed.query) if not k.startswith('utm_') and k not in ('si', 'feature', 'pp'))
+    return urllib.parse.urlunparse((parsed.scheme.lower(), netloc, parsed.path.rstrip('/') or '/', '', urllib.parse.urlencode(query), ''))
+
+
+def get_cache_dir() -> str:
+    if sys.platform == 'win32':
+        return os.path.join(os.getenv('LOCALAPPDATA', os.path.expanduser('~')), 'YT-DLP GUI', 'cache')
+    return os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'yt-dlp-gui')
+
+
+def without_cookies(info: dict) -> dict:
+    """Copy of info without the cookies yt-dlp adds to the info dict and each format, nor Cookie headers, so that
+    login sessions are not written to disk. yt-dlp adds them again from its cookie jar when the info is processed."""
+    def strip(d: dict) -> dict:
+        d = {k: v for k, v in d.items() if k != 'cookies'}
+        if isinstance(d.get('http_headers'), dict):
+            d['http_headers'] = {k: v for k, v in d['http_headers'].items() if k.lower() != 'cookie'}
+        return d
+
+    info = strip(info)
+    for key in ('formats', 'requested_formats', 'requested_downloads'):
+        if isinstance(info.get(key), list):
+            info[key] = [strip(f) if isinstance(f, dict) else f for f in info[key]]
+    return info
+
+
+class MetadataCache:
+    """On-disk LRU cache of sanitized info dicts, keyed by normalized URL and the options that affect extraction.
+    Entries expire by the info dict's own extraction 'epoch', and least recently used entries are evicted above max_bytes.
+    Cookies are left out of the stored dicts, see without_cookies."""
+    KEY_OPTS = ('noplaylist', 'extract_flat', 'cookiesfrombrowser', 'extractor_args', 'age_limit')
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = os.path.join(cache_dir, 'metadata')
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.index = collections.OrderedDict()  # key -> file size, least recently used first
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            files = [(e.stat().st_mtime, e.name[:-len('.json.gz')], e.stat().st_size) for e in os.scandir(self.cache_dir) if e.name.endswith('.json.gz')]
+        except OSError as e:
+            logger.warning(f'Metadata cache disabled: {e}')
+            self.cache_dir = None
+            return
+        for _, key, size in sorted(files):
+            self.index[key] = size
+            self.total_bytes += size
+
+    def make_key(self, url: str, ydl_opts: dict) -> str:
+        relevant = {k: ydl_opts.get(k) for k in self.KEY_OPTS}
+        return hashlib.sha1(f'{normalize_url(url)}\n{json.dumps(relevant, sort_keys=True, default=str)}'.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json.gz')
+
+    def _remove(self, key: str):
+        with self.lock:
+            self.total_bytes -= self.index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def discard(self, url: str, ydl_opts: dict):
+        self._remove(self.make_key(url, ydl_opts))
+
+    def get(self, url: str, ydl_opts: dict) -> Union[dict, None]:
+        key = self.make_key(url, ydl_opts)
+        with self.lock:
+            present = self.cache_dir is not None and key in self.index
+            if not present: self.misses += 1
+        if not present:
+            return None
+        ttl = FLAT_INFO_CACHE_TTL if ydl_opts.get('extract_flat') else FULL_INFO_CACHE_TTL
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            info = None
+        if not info or time.time() - info.get('epoch', 0) > ttl:
+            self._remove(key)
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+            if key in self.index: self.index.move_to_end(key)
+        try:
+            os.utime(self._path(key))  # mtime is the LRU order across restarts
+        except OSError:
+            pass
+        return info
+
+    def put(self, url: str, ydl_opts: dict, info: dict):
+        if self.cache_dir is None or not info:
+            return
+        key = self.make_key(url, ydl_opts)
+        path = self._path(key)
+        try:
+            with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8') as f:
+                json.dump(without_cookies(info), f)
+            os.replace(f'{path}.tmp', path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f'Failed to write metadata cache: {e}')
+            return
+        evicted = []
+        with self.lock:
+            self.total_bytes += size - self.index.pop(key, 0)
+            self.index[key] = size
+            while self.total_bytes > self.max_bytes and len(self.index) > 1:
+                old_key, old_size = self.index.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+
+metadata_cache = MetadataCache(get_cache_dir(), METADATA_CACHE_MAX_BYTES)
+
+
+def get_config_dir() -> str:
+    if sys.platform == 'win32':
+        return os.path.join(os.getenv('APPDATA', os.path.expanduser('~')), 'YT-DLP GUI')
+    return os.path.expanduser('~/.config/yt-dlp')  # same place as last_path.txt
+
+
+class QueueStore:
+    """SQLite journal of the download queue so queued and half-finished tasks survive closing or crashing the app.
+    Rows are written on every state change and deleted once a task leaves the queue."""
+    NON_PERSISTED_OPTS = ('progress_hooks', 'postprocessor_hooks', 'logger')
+
+    def __init__(self, db_path: str):
+        self.lock = threading.RLock()  # reentrant so writes can happen inside batch()
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)  # autocommit, each write is durable
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, path TEXT NOT NULL, '
+                              'ydl_opts TEXT NOT NULL, state TEXT NOT NULL, title TEXT, bytes_done INTEGER NOT NULL DEFAULT 0, filepath TEXT)')
+            if 'filepath' not in {column[1] for column in self.conn.execute('PRAGMA table_info(tasks)')}:  # queues saved by older versions
+                self.conn.execute('ALTER TABLE tasks ADD COLUMN filepath TEXT')
+        except sqlite3.Error as e:
+            logger.warning(f'Download queue will not be saved: {e}')
+            self.conn = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> Union[sqlite3.Cursor, None]:
+        if self.conn is None:
+            return None
+        try:
+            with self.lock:
+                return self.conn.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.warning(f'Failed to save download queue: {e}')
+            return None
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Group the writes made inside into one transaction, for adding many tasks at once"""
+        with self.lock:
+            if self._execute('BEGIN') is None:
+                yield
+                return
+            try:
+                yield
+            finally:
+                self._execute('COMMIT')
+
+    def add(self, url: str, path: str, ydl_opts: dict) -> Union[int, None]:
+        opts = {k: v for k, v in ydl_opts.items() if k not in self.NON_PERSISTED_OPTS}
+        cursor = self._execute('INSERT INTO tasks (url, path, ydl_opts, state) VALUES (?, ?, ?, ?)', (url, path, json.dumps(opts), 'queued'))
+        return cursor.lastrowid if cursor else None
+
+    def update(self, task_id: Union[int, None], **fields):
+        if task_id is None or not fields:
+            return
+        self._execute(f'UPDATE tasks SET {", ".join(f"{k} = ?" for k in fields)} WHERE id = ?', (*fields.values(), task_id))
+
+    def remove(self, task_id: Union[int, None]):
+        if task_id is not None:
+            self._execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+
+    def load(self) -> list[dict]:
+        cursor = self._execute('SELECT id, url, path, ydl_opts, state, title, bytes_done, filepath FROM tasks ORDER BY id')
+        if cursor is None:
+            return []
+        rows = []
+        for task_id, url, path, opts, state, title, bytes_done, filepath in cursor.fetchall():
+            try:
+                rows.append({'id': task_id, 'url': url, 'path': path, 'ydl_opts': json.loads(opts), 'state': state, 'title': title, 'bytes_done': bytes_done,
+                             'filepath': filepath})
+            except ValueError:
+                self.remove(task_id)
+        return rows
+
+
+queue_store = QueueStore(os.path.join(get_config_dir(), 'queue.sqlite3'))
+
+
+class DownloadArchive:
+    """Finished downloads by (extractor, video id) and format, like yt-dlp's --download-archive.
+    The whole index is kept in memory for O(1) lookups from the UI thread, SQLite only makes it persistent."""
+
+    def __init__(self, db_path: str):
+        self.lock = threading.Lock()
+        self.index: dict[tuple[str, str], set[str]] = {}
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS archive (extractor TEXT NOT NULL, video_id TEXT NOT NULL, format TEXT NOT NULL, '
+                              'url TEXT NOT NULL, filepath TEXT, finished_at REAL NOT NULL, PRIMARY KEY (extractor, video_id, format)) WITHOUT ROWID')
+            for extractor, video_id, fmt in self.conn.execute('SELECT extractor, video_id, format FROM archive'):
+                self.index.setdefault((extractor, video_id), set()).add(fmt)
+        except sqlite3.Error as e:
+            logger.warning(f'Download archive will not be saved: {e}')
+            self.conn = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def contains(self, key: tuple[str, str], fmt: str = None) -> bool:
+        """Whether the video was downloaded before, in format fmt or in any format if fmt is None"""
+        formats = self.index.get(key)
+        return bool(formats) and (fmt is None or fmt in formats)
+
+    def add(self, keys: set[tuple[str, str]], fmt: str, url: str, filepath: str = None):
+        """Record a finished download under all keys it is known by, e.g. the one from its URL and the one from its info"""
+        with self.lock:
+            for key in keys:
+                self.index.setdefault(key, set()).add(fmt)
+            if self.conn is None:
+                return
+            try:
+                self.conn.executemany('INSERT OR REPLACE INTO archive (extractor, video_id, format, url, filepath, finished_at) VALUES (?, ?, ?, ?, ?, ?)',
+                                      [(*key, fmt, url, filepath, time.time()) for key in keys])
+            except sqlite3.Error as e:
+                logger.warning(f'Failed to save download archive: {e}')
+
+
+download_archive = DownloadArchive(os.path.join(get_config_dir(), 'archive.sqlite3'))
+
+
+def load_keyring():
+    """The optional keyring module (Windows Credential Manager, macOS Keychain, Secret Service), None if it is not installed"""
+    try:
+        import keyring
+        import keyring.errors
+    except ImportError:
+        return None
+    return keyring
+
+
+class BrowserCookies:
+    """Cookies of each browser used with cookiesfrombrowser, read and decrypted once into a jar that every pooled YoutubeDL
+    shares instead of each instance reading the browser's cookie database again (slow, and it locks Chrome/Edge profiles).
+    A jar is reloaded in place after COOKIE_JAR_TTL or when an authentication error suggests it is stale.
+    With save_path set, the jar is also kept in a file encrypted with AES-GCM (needs pycryptodomex, installed with
+    yt-dlp[default]) under a key kept in the OS keyring (needs keyring), so a restart does not read the browser again within the TTL."""
+
+    def __init__(self, ttl: float, save_path: str = None):
+        self.ttl = ttl
+        self.save_path = save_path
+        self.lock = threading.Lock()
+        self.jars: dict[tuple, list] = {}  # browser spec -> [jar, loaded_at]
+        self.loads = 0
+
+    @staticmethod
+    def spec_key(spec: Union[list, tuple]) -> tuple:
+        return tuple(spec)
+
+    def get(self, spec: Union[list, tuple]) -> 'yt_dlp.cookies.YoutubeDLCookieJar':
+        """The shared jar for spec, (re)loaded from the browser when missing or older than the TTL"""
+        key = self.spec_key(spec)
+        with self.lock:  # one thread reads the browser, the others wait for its cookies
+            entry = self.jars.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                cookies = self._read_browser(key)
+                if entry is None:
+                    entry = self.jars[key] = [cookies, 0]
+                else:  # instances hold on to the jar, so update it instead of replacing it
+                    entry[0].clear()
+                    for cookie in cookies:
+                        entry[0].set_cookie(cookie)
+                entry[1] = time.time()
+                self.save()
+            return entry[0]
+
+    def _read_browser(self, key: tuple) -> 'yt_dlp.cookies.YoutubeDLCookieJar':
+        cookies = load_yt_dlp().cookies
+        browser_name, profile, keyring, container = (*key, None, None, None)[:4]
+        self.loads += 1
+        logger.info(f'Reading cookies from {browser_name}')
+        return cookies.extract_cookies_from_browser(browser_name, profile, cookies.YDLLogger(), keyring=keyring, container=container)
+
+    def invalidate(self, spec: Union[list, tuple] = None):
+        """Reload the cookies of spec (all browsers if None) from the browser on next use"""
+        with self.lock:
+            for key, entry in self.jars.items():
+                if spec is None or key == self.spec_key(spec): entry[1] = 0
+
+    def refresh_after(self, e: object, ydl_opts: dict) -> bool:
+        """Whether e looks like an authentication error that cookies fresh from the browser might fix.
+        The jar is then invalidated, but at most once per COOKIE_RELOAD_MIN_INTERVAL so retrying stays bounded."""
+        spec = ydl_opts.get('cookiesfrombrowser')
+        if not spec or not AUTH_ERROR_PATTERN.search(str(e)):
+            return False
+        with self.lock:
+            entry = self.jars.get(self.spec_key(spec))
+            if entry is None or time.time() - entry[1] < COOKIE_RELOAD_MIN_INTERVAL:
+                return False
+            entry[1] = 0
+        logger.info(f'Authentication failed, reading cookies from {spec[0]} again')
+        return True
+
+    @staticmethod
+    def can_save() -> bool:
+        return load_yt_dlp().dependencies.Cryptodome.AES is not None and load_keyring() is not None
+
+    @staticmethod
+    def _key(create: bool) -> Union[bytes, None]:
+        """Key of the saved cookies from the OS keyring, a new one if create and there is none yet. None if unavailable."""
+        keyring = load_keyring()
+        if keyring is None:
+            return None
+        try:
+            key = keyring.get_password(KEYRING_SERVICE, 'cookies')
+            if key is None and create:
+                key = os.urandom(32).hex()
+                keyring.set_password(KEYRING_SERVICE, 'cookies', key)
+        except keyring.errors.KeyringError as e:  # e.g. no keyring backend on a headless Linux
+            logger.warning(f'OS keyring not available: {e}')
+            return None
+        return bytes.fromhex(key) if key else None
+
+    def save(self):
+        """Write all jars encrypted to save_path, if set. Called with the lock held."""
+        aes = load_yt_dlp().dependencies.Cryptodome.AES
+        if not self.save_path or aes is None:
+            return
+        key = self._key(create=True)
+        if key is None:
+            return
+        data = [{'spec': list(key), 'loaded_at': loaded_at,
+                 'cookies': [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'secure': c.secure, 'expires': c.expires,
+                              'port': c.port, 'discard': c.discard, 'rest': c._rest} for c in jar]}
+                for key, (jar, loaded_at) in self.jars.items()]
+        try:
+            cipher = aes.new(key, aes.MODE_GCM)
+            ciphertext, tag = cipher.encrypt_and_digest(json.dumps(data).encode())
+            with open(os.open(f'{self.save_path}.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(cipher.nonce + tag + ciphertext)
+            os.replace(f'{self.save_path}.tmp', self.save_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not save cookies: {e}')
+
+    def load_saved(self) -> list:
+        """Load the jars saved by a previous session into memory, returns the spec used last or None"""
+        aes = load_yt_dlp().dependencies.Cryptodome.AES
+        if not self.save_path or aes is None or not os.path.exists(self.save_path):
+            return None
+        key = self._key(create=False)
+        if key is None:
+            return None
+        try:
+            with open(self.save_path, 'rb') as f:
+                blob = f.read()
+            data = json.loads(aes.new(key, aes.MODE_GCM, nonce=blob[:16]).decrypt_and_verify(blob[32:], blob[16:32]))
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not load saved cookies: {e}')
+            return None
+        cookies = load_yt_dlp().cookies
+        with self.lock:
+            for saved in data:
+                jar = cookies.YoutubeDLCookieJar()
+                for c in saved['cookies']:
+                    jar.set_cookie(http.cookiejar.Cookie(0, c['name'], c['value'], c['port'], bool(c['port']), c['domain'], True, c['domain'].startswith('.'),
+                                                         c['path'], True, c['secure'], c['expires'], c['discard'], None, None, c['rest']))
+                self.jars[self.spec_key(saved['spec'])] = [jar, saved['loaded_at']]
+        return data[-1]['spec'] if data else None
+
+    def remember(self, save_path: str):
+        """Keep the cookies in save_path from now on, starting with the ones already loaded"""
+        with self.lock:
+            self.save_path = save_path
+            self.save()
+
+    def forget(self):
+        """Delete the saved cookies and stop saving them"""
+        if not self.save_path:
+            return
+        try:
+            os.remove(self.save_path)
+        except OSError:
+            pass
+        keyring = load_keyring()
+        if keyring is not None:
+            with contextlib.suppress(keyring.errors.KeyringError):
+                keyring.delete_password(KEYRING_SERVICE, 'cookies')
+        self.save_path = None
+
+
+class RoutedLogger:
+    """yt-dlp logger of a pooled YoutubeDL, forwards to the logger of the ydl_opts it is checked out with (if any)"""
+
+    def __init__(self, routes: dict):
+        self.routes = routes
+
+    def debug(self, msg: str):
+        if self.routes['logger']: self.routes['logger'].debug(msg)
+
+    def info(self, msg: str):
+        if self.routes['logger']: self.routes['logger'].info(msg)
+
+    def warning(self, msg: str):
+        if self.routes['logger']: self.routes['logger'].warning(msg)
+
+    def error(self, msg: str):
+        if self.routes['logger']: self.routes['logger'].error(msg)
+
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL instances, reused by tasks with the same options so the extractors, cookie jar and
+    request handlers (with their keep-alive connections) are set up once instead of per task.
+    An instance is used by one task at a time, its hooks and logger forward to the ones in the ydl_opts it was checked out with.
+    Instances that raised are closed instead of reused, as are the least recently used ones above max_idle."""
+    HOOK_OPTS = ('progress_hooks', 'postprocessor_hooks')
+    NON_KEY_OPTS = (*HOOK_OPTS, 'logger')
+
+    def __init__(self, max_idle: int):
+        self.lock = threading.Lock()
+        self.idle: collections.OrderedDict[str, list] = collections.OrderedDict()  # options key -> idle (ydl, routes), least recently used first
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+
+    @contextlib.contextmanager
+    def get(self, ydl_opts: dict):
+        opts = {k: v for k, v in ydl_opts.items() if k not in self.NON_KEY_OPTS}
+        key = json.dumps(opts, sort_keys=True, default=str)
+        with self.lock:
+            instances = self.idle.get(key)
+            instance = instances.pop() if instances else None
+            if instances is not None and not instances: del self.idle[key]
+            if instance: self.reused += 1
+            else: self.created += 1
+        if instance is None:
+            routes = {'progress_hooks': [], 'postprocessor_hooks': [], 'logger': None}
+            opts = copy.deepcopy(opts)  # the instance outlives the task, don't share mutable options with it
+            for name in self.HOOK_OPTS:
+                opts[name] = [lambda d, name=name: [hook(d) for hook in routes[name]]]
+            opts['logger'] = RoutedLogger(routes)
+            browser = opts.pop('cookiesfrombrowser', None)  # read once by browser_cookies instead of by every instance
+            instance = (load_yt_dlp().YoutubeDL(opts), routes)
+            if browser: instance[0].cookiejar = browser_cookies.get(browser)
+        elif ydl_opts.get('cookiesfrombrowser'):
+            browser_cookies.get(ydl_opts['cookiesfrombrowser'])  # reloads the shared jar once it is older than the TTL
+        ydl, routes = instance
+        for name in self.HOOK_OPTS:
+            routes[name] = ydl_opts.get(name) or []
+        routes['logger'] = ydl_opts.get('logger')
+        try:
+            yield ydl
+        except BaseException:
+            ydl.close()
+            raise
+        routes.update(progress_hooks=[], postprocessor_hooks=[], logger=None)
+        with self.lock:
+            self.idle.setdefault(key, []).append(instance)
+            self.idle.move_to_end(key)
+            evicted = []
+            while sum(len(instances) for instances in self.idle.values()) > self.max_idle:
+                oldest_key, instances = next(iter(self.idle.items()))
+                evicted.append(instances.pop(0)[0])
+                if not instances: del self.idle[oldest_key]
+        for old in evicted:
+            old.close()
+
+
+browser_cookies = BrowserCookies(COOKIE_JAR_TTL)
+ydl_pool = YoutubeDLPool(max_idle=MAX_DOWNLOAD_WORKERS + 3)  # enough for every download and extraction worker
+
+
+def apply_performance_profile(ydl_opts: dict, profile: str):
+    """Replace the performance related options in ydl_opts with the ones of the given profile"""
+    for key in ('concurrent_fragment_downloads', 'http_chunk_size', 'buffersize'):
+        ydl_opts.pop(key, None)
+    ydl_opts['extractor_args'] = copy.deepcopy(DEFAULT_EXTRACTOR_ARGS)
+    ydl_opts.update(copy.deepcopy(PERFORMANCE_PROFILES.get(profile, {})))
+
+
+def is_info_fresh(info: Union[dict, None]) -> bool:
+    """Whether an extracted info dict is recent enough that its media URLs can be used without re-extracting"""
+    return bool(info) and info.get('_type', 'video') == 'video' and time.time() - info.get('epoch', 0) < INFO_REUSE_MAX_AGE
+
+
+def download(urls: Union[list, str], ydl_opts=None, ignore_error: bool = False, info: dict = None) -> bool:
+    """Return whether download is successful. If a fresh info dict from a previous extraction is given, it is fed
+    back to yt-dlp's process_ie_result instead of running the extractor again (same as --load-info-json)"""
+    if ydl_opts is None: ydl_opts = copy.deepcopy(ydl_base_opts)
+    load_yt_dlp()
+    try:
+        with ydl_pool.get(ydl_opts) as ydl:
+            if is_info_fresh(info):
+                try:
+                    ydl.process_ie_result(ydl.sanitize_info(copy.deepcopy(info), remove_private_keys=True), download=True)
+                except yt_dlp.utils.DownloadError as e:  # e.g. media URL expired early, retry with a fresh extraction
+                    logger.warning(f'Download from extracted info failed: {e}; retrying with URL')
+                    ydl.download(urls if isinstance(urls, list) else [urls])
+            else:
+                ydl.download(urls if isinstance(urls, list) else [urls])
+    except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
+        if browser_cookies.refresh_after(e, ydl_opts): return download(urls, ydl_opts, ignore_error, info)
+        if ignore_error: return False
+        return handle_login_required(e, urls, ydl_opts, download)
+    except Exception as e:
+        report_error('Error', f'Error while downloading: {e}')
+        return False
+    else:
+        return True
+
+
+_extractions_in_flight: dict[str, concurrent.futures.Future] = {}  # metadata cache key -> result of the extraction running for it
+_extractions_lock = threading.Lock()
+
+
+def extract_info(url: str, ydl_opts: dict, ignore_error: bool = False, info: dict = None) -> dict:
+    """If a fresh info dict is given or cached, only format selection is re-run on it with ydl_opts, without calling the extractor.
+    Concurrent calls for the same video share one extraction, each re-running format selection with its own ydl_opts."""
+    if not is_info_fresh(info): info = metadata_cache.get(url, ydl_opts)
+    if is_info_fresh(info):
+        return _extract_info(url, ydl_opts, ignore_error, info)
+    key = metadata_cache.make_key(url, ydl_opts)
+    with _extractions_lock:
+        pending = _extractions_in_flight.get(key)
+        if pending is None:
+            running = _extractions_in_flight[key] = concurrent.futures.Future()
+    if pending is not None:
+        info = pending.result()
+        return _extract_info(url, ydl_opts, ignore_error, info if is_info_fresh(info) else None)
+    info = {}
+    try:
+        info = _extract_info(url, ydl_opts, ignore_error)
+        return info
+    finally:
+        with _extractions_lock:
+            del _extractions_in_flight[key]
+        running.set_result(info)
+
+
+def _extract_info(url: str, ydl_opts: dict, ignore_error: bool = False, info: dict = None) -> dict:
+    load_yt_dlp()
+    try:
+        with ydl_pool.get(ydl_opts) as ydl:
+            if is_info_fresh(info):
+                return ydl.sanitize_info(ydl.process_ie_result(ydl.sanitize_info(copy.deepcopy(info), remove_private_keys=True), download=False))
+            info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+            metadata_cache.put(url, ydl_opts, info)
+            return info
+    except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
+        if browser_cookies.refresh_after(e, ydl_opts): return _extract_info(url, ydl_opts, ignore_error, info)
+        if ignore_error: return {}
+        result = handle_login_required(e, url, ydl_opts, _extract_info)
+        if not result:
+            return {}
+        else:  # success
+            return result
+    except Exception as e:
+        report_error('Error', f'Error while extracting info: {e}')
+        return {}
+
+
+def _stream_entries(ydl: 'yt_dlp.YoutubeDL', info: dict, on_playlist: Callable[[dict, queue.SimpleQueue, threading.Event], None]) -> tuple[dict, bool]:
+    """Page through the lazy entries of an unprocessed playlist result, handing each page over as it arrives.
+    Returns the playlist with all entries seen and whether enumeration completed."""
+    pages, stop = queue.SimpleQueue(), threading.Event()
+    header = {k: v for k, v in info.items() if k != 'entries'}
+    on_playlist(ydl.sanitize_info(dict(header)), pages, stop)
+    entries, page, complete = [], [], False
+    try:
+        for entry in info.get('entries') or []:
+            if stop.is_set():
+                break
+            if entry is None:
+                continue
+            entries.append(entry)
+            page.append(entry)
+            if len(page) >= PLAYLIST_PAGE_SIZE:
+                pages.put(page)
+                page = []
+        else:
+            complete = True
+    except Exception as e:
+        logger.warning(f'Playlist enumeration stopped after {len(entries)} entries: {e}')
+    finally:
+        if page: pages.put(page)
+        pages.put(None)  # end of playlist
+    return ydl.sanitize_info(dict(header, entries=entries)), complete
+
+
+def extract_flat_info(url: str, on_playlist: Callable[[dict, queue.SimpleQueue, threading.Event], None] = None) -> dict:
+    """Quickly extract playlist metadata without full format extraction.
+    Uses extract_flat='in_playlist' so only titles/IDs/durations are fetched.
+    For single videos, yt-dlp returns the normal info dict (no 'entries' key).
+    If on_playlist is given, a playlist is not waited for: on_playlist(playlist_info, pages, stop) is called as soon as
+    the playlist itself is known, then lists of entries are put into pages while yt-dlp pages through it (None marks the end)
+    until stop is set. Cached playlists are returned whole without calling on_playlist."""
+    ydl_opts = copy.deepcopy(ydl_base_opts)
+    ydl_opts['extract_flat'] = 'in_playlist'
+    ydl_opts['quiet'] = True
+    ydl_opts['no_warnings'] = True
+    cached = metadata_cache.get(url, ydl_opts)
+    if cached:
+        return cached
+    load_yt_dlp()
+    try:
+        with ydl_pool.get(ydl_opts) as ydl:
+            if on_playlist is None:
+                info = ydl.extract_info(url, download=False)
+            else:
+                info = ydl.extract_info(url, download=False, process=False)
+                while info and info.get('_type') == 'url':  # e.g. channel URL redirecting to its videos tab
+                    info = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+                if info and info.get('_type') == 'playlist':
+                    info, complete = _stream_entries(ydl, info, on_playlist)
+                    if complete: metadata_cache.put(url, ydl_opts, info)
+                    return info
+                elif info:
+                    info = ydl.process_ie_result(info, download=False)
+            info = ydl.sanitize_info(info) if info else {}
+            metadata_cache.put(url, ydl_opts, info)
+            return info
+    except Exception as e:
+        logger.warning(f'Flat extraction failed: {e}')
+        return {}
+
+
+def parse_info(info: dict, best_format_only: bool = True) -> dict:
+    title = info.get('title', 'Unknown Title')
+    duration = info.get('duration_string', 'Unknown Duration')
+    size = info.get('filesize', info.get('filesize_approx', 0))
+    subtitles = info.get('subtitles', {})
+    if best_format_only:  # only 1 for video and/or 1 for audio
+        formats = {'video': None, 'audio': None}
+        if 'requested_formats' in info:  # best video AND best audio
+            temp = [parse_format(f) for f in info['requested_formats']]  # best video/best audio only
+            for f in temp:
+                if f['video']: formats['video'] = f['video']
+                if f['audio']: formats['audio'] = f['audio']
+        else:  # best video OR audio only
+            format_id = info.get('format_id')
+            if format_id and 'formats' in info:
+                for f in info['formats']:
+                    if f['format_id'] == format_id:
+                        formats = parse_format(f)
+                        break
+    else:
+        formats = [parse_format(f) for f in displayable_formats(info)]
+    # noinspection PyUnboundLocalVariable
+    return {'title': title, 'duration': duration, 'size': size, 'subtitles': subtitles, 'formats': formats}
+
+
+def displayable_formats(info: dict) -> list[dict]:
+    """Formats of info that can be downloaded and contain video or audio, without storyboards"""
+    return [f for f in info.get('formats', []) if f.get('format_note', '') != 'storyboard' and (f.get('vcodec', 'none') != 'none' or f.get('acodec', 'none') != 'none') and f.get('url', '')]
+
+
+def parse_codec(codec: str) -> str:
+    if not codec: return 'unknown codec'
+    mapping = {'mp4v': 'H263', 'av01': 'AV1', 'avc1': 'H264/AVC', 'hev1': 'H265/HEVC', 'vp9': 'VP9', 'vp09': 'VP9', 'vp8': 'VP8', 'mp4a': 'AAC', 'opus': 'Opus'}
+    return mapping.get(codec.split('.')[0].lower(), codec.split('.')[0].lower())
+
+
+def parse_format(format: dict) -> dict:
+    parsed = {'video': {}, 'audio': {}}
+    # generic/direct links may not report codecs at all, yt-dlp treats a missing codec as unknown rather than absent
+    contains_video = format.get('vcodec') != 'none'
+    contains_audio = format.get('acodec') != 'none'
+    parsed['format_id'] = format['format_id']
+    parsed['ext'] = format['ext']
+    parsed['size'] = format.get('filesize', format.get('filesize_approx', 0))
+
+    if contains_video: parsed['video'] = {'resolution': format.get('resolution'), 'fps': format.get('fps'),
+                                          'codec': parse_codec(format.get('vcodec')),
+                                          'hdr': format.get('dynamic_range') not in ('SDR', None)}
+    if contains_audio: parsed['audio'] = {'sample_rate': f'{round(format["asr"] / 1000, 2)}khz' if format.get('asr') else 'unknown sample rate',
+                                          'bitrate': f'{round(format["abr"])}kbps' if format.get('abr', None) and float(format['abr']) else 'unknown bitrate',
+                                          'codec': parse_codec(format.get('acodec'))}
+    return parsed
+
+
+def format_selector(info: dict, format_ids: str) -> str:
+    """Turn format IDs picked from one video's formats (e.g. '137+140') into a format selector that picks the closest
+    match on any other video: same maximum height, codec and audio bitrate, relaxed step by step when a video has no such format"""
+    by_id = {f.get('format_id'): f for f in info.get('formats') or []}
+    video = audio = None
+    for format_id in format_ids.split('+'):
+        f = by_id.get(format_id)
+        if not f: continue
+        if f.get('vcodec') != 'none': video = f
+        if f.get('acodec') != 'none': audio = f
+    if video is None and audio is None:
+        return 'bv*+ba/b'
+
+    def codec(f: dict, key: str) -> str:
+        value = (f.get(key) or '').split('.')[0]
+        return f'[{key}^={value}]' if value and value != 'none' else ''
+
+    height = f'[height<=?{video["height"]}]' if video and video.get('height') else ''
+    abr = f'[abr<=?{math.ceil(audio["abr"])}]' if audio and audio.get('abr') else ''
+    if video is not None and video is audio:  # muxed
+        steps = [f'b{height}{codec(video, "vcodec")}{codec(video, "acodec")}', f'b{height}', 'b', 'bv*+ba']
+    elif video is not None and audio is not None:
+        steps = [f'bv{height}{codec(video, "vcodec")}+ba{codec(audio, "acodec")}{abr}', f'bv{height}+ba{abr}', f'bv{height}+ba',
+                 f'b{height}', 'bv*+ba', 'b']
+    elif video is not None:
+        steps = [f'bv{height}{codec(video, "vcodec")}', f'bv{height}', 'bv', 'bv*']
+    else:
+        steps = [f'ba{codec(audio, "acodec")}{abr}', f'ba{abr}', 'ba', 'ba*']
+    return '/'.join(dict.fromkeys(steps))  # drop steps that are the same once empty constraints are left out
+
+
+class FormatTable:
+    """The displayable formats of one info dict in columns, one list per field indexed by row, with the display text
+    and numeric sort keys computed once, so the details window can sort, filter and pick formats without parsing again"""
+    MUXED, VIDEO, AUDIO = 'Video+Audio', 'Video only', 'Audio only'
+    COLUMNS = ('kind', 'resolution', 'fps', 'vcodec', 'acodec', 'bitrate', 'size', 'ext', 'format_id')
+    CODEC_RANK = {'AV1': 5, 'VP9': 4, 'H265/HEVC': 3, 'H264/AVC': 2, 'VP8': 1, 'Opus': 3, 'AAC': 2, 'vorbis': 1}  # higher is better at the same bitrate
+
+    def __init__(self, info: dict):
+        self.formats = displayable_formats(info)
+        self.format_id, self.kind, self.ext, self.vcodec, self.acodec, self.hdr = [], [], [], [], [], []
+        self.height, self.fps, self.bitrate, self.size, self.codec_rank = [], [], [], [], []
+        for f in self.formats:
+            has_video, has_audio = f.get('vcodec') != 'none', f.get('acodec') != 'none'
+            self.format_id.append(f['format_id'])
+            self.kind.append(self.MUXED if has_video and has_audio else self.VIDEO if has_video else self.AUDIO)
+            self.ext.append(f.get('ext') or '')
+            self.vcodec.append(parse_codec(f.get('vcodec')) if has_video else '')
+            self.acodec.append(parse_codec(f.get('acodec')) if has_audio else '')
+            self.hdr.append(has_video and f.get('dynamic_range') not in ('SDR', None))
+            resolution = f.get('resolution') or ''
+            height = f.get('height') or (int(resolution.split('x')[1]) if resolution.count('x') == 1 and resolution.split('x')[1].isdigit() else 0)
+            self.height.append(height if has_video else 0)
+            self.fps.append(f.get('fps') or 0 if has_video else 0)
+            self.bitrate.append(float(f.get('tbr') or f.get('vbr') or f.get('abr') or 0))
+            self.size.append(f.get('filesize') or f.get('filesize_approx') or 0)
+            self.codec_rank.append(self.CODEC_RANK.get(self.vcodec[-1] if has_video else self.acodec[-1], 0))
+
+    def __len__(self) -> int:
+        return len(self.format_id)
+
+    def row_values(self, row: int) -> tuple:
+        """Display text of row in the order of COLUMNS"""
+        resolution = f'{self.height[row]}p' if self.height[row] else self.formats[row].get('resolution') or ''
+        return (self.kind[row], resolution + (' HDR' if self.hdr[row] else ''), f'{self.fps[row]:g}' if self.fps[row] else '',
+                self.vcodec[row], self.acodec[row], f'{round(self.bitrate[row])}kbps' if self.bitrate[row] else '',
+                format_bytes(self.size[row]) if self.size[row] else 'unknown', self.ext[row], self.format_id[row])
+
+    def sort_keys(self, column: str) -> list:
+        """Key of every row for sorting by column, numbers rather than the display text where there is one"""
+        if column == 'kind': return [(self.kind[row] != self.MUXED, self.kind[row]) for row in range(len(self))]
+        if column == 'resolution': return [(self.height[row], self.fps[row], self.hdr[row]) for row in range(len(self))]
+        if column in ('vcodec', 'acodec'): return [(self.codec_rank[row] if getattr(self, column)[row] else -1, getattr(self, column)[row]) for row in range(len(self))]
+        return getattr(self, column)
+
+    def quality(self, row: int) -> tuple:
+        return self.height[row], self.fps[row], self.bitrate[row], self.codec_rank[row]
+
+    def parse(self, row: int) -> dict:
+        return parse_format(self.formats[row])
+
+    def best(self, max_height: int = None, vcodec: str = None, max_size: int = None) -> list[int]:
+        """Rows of the best download within the limits in one pass over the table: the best video only format with the
+        best audio only format if there is one that fits (size limits count both), else the best format with both.
+        Formats of unknown size do not count as fitting a size limit. Returns [] when nothing fits."""
+        audio, muxed, videos = None, None, []
+        for row in range(len(self)):
+            if max_size and not self.size[row] or max_size and self.size[row] > max_size:
+                continue
+            if self.kind[row] == self.AUDIO:
+                if audio is None or self.quality(row) > self.quality(audio): audio = row
+                continue
+            if max_height and self.height[row] > max_height or vcodec and self.vcodec[row] != vcodec:
+                continue
+            if self.kind[row] == self.VIDEO:
+                videos.append(row)
+            elif muxed is None or self.quality(row) > self.quality(muxed):
+                muxed = row
+        for video in sorted(videos, key=self.quality, reverse=True):
+            if audio is not None and (not max_size or self.size[video] + self.size[audio] <= max_size):
+                if muxed is None or self.quality(video) >= self.quality(muxed):
+                    return [video, audio]
+                break
+        return [muxed] if muxed is not None else []
+
+
+def is_valid_url(url: str) -> bool:
+    try:
+        result = urllib.parse.urlparse(url)
+        return all([result.scheme, result.netloc])
+    except:
+        return False
+
+
+@functools.lru_cache(maxsize=4096)
+def video_key(url: str) -> tuple[str, str]:
+    """Canonical identity of the video behind url without network access: (extractor, video id) like
+    yt-dlp's download archive when an extractor recognizes the URL, else ('url', normalized url)"""
+    for ie in load_yt_dlp().extractor.gen_extractor_classes():
+        if ie.ie_key() != 'Generic' and ie.suitable(url):
+            video_id = ie.get_temp_id(url)
+            if video_id: return ie.ie_key().lower(), video_id
+            break
+    return 'url', normalize_url(url)
+
+
+def known_video_key(info: dict) -> Union[tuple[str, str], None]:
+    """video_key() of an info dict or flat playlist entry that names its extractor and id, None if it doesn't"""
+    ie_key = info.get('extractor_key') or info.get('ie_key')
+    return (ie_key.lower(), str(info['id'])) if ie_key and info.get('id') else None
+
+
+def entry_video_key(entry: dict, playlist_url: str) -> tuple[str, str]:
+    """video_key() of a flat playlist entry, which usually names its extractor and id already"""
+    return known_video_key(entry) or video_key(get_entry_url(entry, playlist_url))
+
+
+def archive_format(ydl_opts: dict) -> str:
+    """Format part of a download archive key: the format selection and the audio conversion, if any"""
+    codec = next((pp['preferredcodec'] for pp in ydl_opts.get('postprocessors') or [] if pp.get('key') == 'FFmpegExtractAudio'), None)
+    return (ydl_opts.get('format') or 'default') + (f' -> {codec}' if codec else '')
+
+
+def parse_url_list(text: str) -> list[str]:
+    """URLs from text with one or more per line, e.g. a batch file or clipboard contents. Lines starting with # are skipped."""
+    return [word for line in text.splitlines() if not line.lstrip().startswith('#') for word in line.split()]
+
+
+def filter_new_urls(urls: list[str], queued_urls: list[str], fmt: str = None) -> tuple[list[str], int, int]:
+    """Valid URLs of urls, in order, without the ones already queued, in the download archive (in format fmt, or any) or repeated.
+    Returns (new urls, number of invalid urls, number of duplicates). Takes a while for thousands of URLs, run it off the UI thread."""
+    valid = [url for url in urls if is_valid_url(url)]
+    seen = {video_key(url) for url in queued_urls}
+    new_urls = []
+    for url in valid:
+        key = video_key(url)
+        if key not in seen and not download_archive.contains(key, fmt):
+            seen.add(key)
+            new_urls.append(url)
+    return new_urls, len(urls) - len(valid), len(valid) - len(new_urls)
+
+
+def get_entry_url(entry: dict, playlist_url: str) -> str:
+    """Construct a direct video URL from a flat playlist entry.
+    For YouTube, flat entries may have 'url' as just a video ID.
+    For other extractors, 'url' may already be a full URL."""
+    entry_url = entry.get('url', '')
+    if entry_url.startswith(('http://', 'https://')):
+        return entry_url
+    # YouTube-style: url is just a video ID
+    video_id = entry_url or entry.get('id', '')
+    if video_id:
+        parsed = urllib.parse.urlparse(playlist_url)
+        if 'youtube' in parsed.netloc or 'youtu.be' in parsed.netloc:
+            return f'https://www.youtube.com/watch?v={video_id}'
+        # For other sites, try constructing from the base domain
+        return f'{parsed.scheme}://{parsed.netloc}/watch?v={video_id}'
+    return playlist_url
+
+
+def build_ydl_opts(path: str, mode: str = 'video_best') -> dict:
+    """Options for downloading a single video into path, mode is 'video_best' or 'audio_best'"""
+    ydl_opts = copy.deepcopy(ydl_base_opts)
+    ydl_opts['noplaylist'] = True
+    if mode == 'audio_best': ydl_opts.update({'format': 'bestaudio'})
+    ydl_opts['outtmpl'] = os.path.join(path, ydl_opts['outtmpl'] if isinstance(ydl_opts['outtmpl'], str) else ydl_opts['outtmpl']['default'])
+    if mode == 'audio_best': ydl_opts['outtmpl'] = ydl_opts['outtmpl'].replace('.%(ext)s', '_audio.%(ext)s')
+    return ydl_opts
+
+
+def use_scratch_dir(ydl_opts: dict, path: str, scratch_dir: str):
+    """Have yt-dlp write .part files, fragments and merge inputs to scratch_dir and move only the finished file into path"""
+    outtmpl = ydl_opts.get('outtmpl')
+    if not isinstance(outtmpl, str):
+        return
+    try:
+        relative = os.path.relpath(outtmpl, path)
+    except ValueError:  # on another drive on Windows
+        return
+    if relative.startswith(os.pardir):
+        return  # output template outside of the download directory, leave it as it is
+    ydl_opts['outtmpl'] = relative
+    ydl_opts['paths'] = {'home': path, 'temp': scratch_dir}
+
+
+def selected_formats(info: dict, format_spec: str = None) -> list[dict]:
+    """Formats info will be downloaded in. Explicit format IDs like '137+140', picked in the details window from an info dict
+    extracted with the default selection, take precedence over the formats yt-dlp selected during that extraction."""
+    by_id = {fmt.get('format_id'): fmt for fmt in info.get('formats') or []}
+    picked = [by_id.get(format_id) for format_id in (format_spec or '').split('+')]
+    if format_spec and all(picked):
+        return picked
+    return info.get('requested_formats') or [info]
+
+
+def estimate_download_size(info: dict, formats: list[dict]) -> int:
+    """Bytes formats of info will take, from their reported or approximate size, else bitrate and duration. 0 when unknown."""
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and info.get('duration'):
+            size = fmt['tbr'] * 1000 / 8 * info['duration']
+        total += size or 0
+    return int(total)
+
+
+def volume_of(path: str) -> tuple[int, str]:
+    """Device id of the volume path is (or will be created) on and the closest existing directory to ask for free space"""
+    path = os.path.abspath(path)
+    while not os.path.isdir(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev, path
+
+
+def reserve_space(path: str, size: int):
+    """Create or resize a placeholder file of size bytes that actually takes the space, not a sparse one"""
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.truncate(size)
+        if size and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), 0, size)  # truncate alone leaves a sparse file on Linux
+
+
+def transcode_audio(path: str, codec: str, quality: Union[int, float, None], ffmpeg_location: str = None,
+                    duration: float = None, on_progress: Callable[[float], None] = None) -> str:
+    """Convert a downloaded file to codec like the FFmpegExtractAudio postprocessor, in a separate ffmpeg process.
+    Makes the same choices: the stream is copied when the file already has the codec, otherwise it is encoded
+    with the codec's ffmpeg options from ACODECS and the postprocessor's quality mapping.
+    on_progress(fraction) is called with the position parsed from ffmpeg's -progress output.
+    The source file is replaced by the converted one, whose path is returned."""
+    from yt_dlp.postprocessor.ffmpeg import ACODECS, FFmpegExtractAudioPP
+    location = ffmpeg_location if ffmpeg_location and os.path.exists(ffmpeg_location) else None  # else found on PATH
+    token = FFmpegExtractAudioPP._ffmpeg_location.set(location)
+    try:
+        pp = FFmpegExtractAudioPP(preferredcodec=codec, preferredquality=quality)
+        ffmpeg = pp.executable
+        source_ext = os.path.splitext(path)[1][1:]
+        if codec == 'best' and source_ext in pp.COMMON_AUDIO_EXTS:
+            return path
+        file_codec = pp.get_audio_codec(path)
+    finally:
+        FFmpegExtractAudioPP._ffmpeg_location.reset(token)
+    if file_codec is None:
+        raise RuntimeError('audio conversion failed: unable to obtain file audio codec with ffprobe')
+    if file_codec == 'aac' and codec in ('m4a', 'best'):  # lossless, but in another container
+        (extension, _, more_opts), encoder = ACODECS['m4a'], 'copy'
+    elif codec in ('best', file_codec) and file_codec in ACODECS:
+        (extension, _, more_opts), encoder = ACODECS[file_codec], 'copy'
+    else:
+        extension, encoder, more_opts = ACODECS['mp3' if codec == 'best' else codec]
+    codec_args = [*more_opts, *(pp._quality_args(encoder) if encoder != 'copy' else [])]
+    new_path = os.path.splitext(path)[0] + '.' + extension
+    if new_path == path and encoder == 'copy':
+        return path  # already in the target format
+    temp_path = os.path.splitext(path)[0] + '.temp.' + extension if new_path == path else new_path
+    args = [ffmpeg, '-y', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1', '-i', path, '-vn',
+            *(['-acodec', encoder] if encoder else []), *codec_args, temp_path]
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+    for line in process.stdout:
+        key, _, value = line.strip().partition('=')
+        # out_time_ms is in microseconds as well, older ffmpeg builds only print that one
+        if key in ('out_time_us', 'out_time_ms') and value.isdigit() and duration and on_progress:
+            on_progress(min(int(value) / 1_000_000 / duration, 1.0))
+    error = process.stderr.read()
+    if process.wait() != 0:
+        if os.path.exists(temp_path): os.remove(temp_path)
+        raise RuntimeError(f'audio conversion failed: {error.strip() or f"ffmpeg exited with {process.returncode}"}')
+    if temp_path != new_path:
+        os.replace(temp_path, new_path)
+    else:
+        os.remove(path)
+    return new_path
+
+
+def parse_rate(text: str) -> Union[int, None]:
+    """Bytes per second from a rate like '500K' or '2.5M' (per second), None for unlimited (empty text)"""
+    if not text.strip():
+        return None
+    rate = load_yt_dlp().utils.parse_bytes(text.strip().removesuffix('/s'))
+    if rate is None:
+        raise ValueError(f'Invalid rate: {text}')
+    return rate
+
+
+def parse_schedule(text: str) -> list[tuple[int, int, Union[int, None]]]:
+    """Time of day limits like '09:00-17:00=500K, 22:00-06:00=0' as (start minute, end minute, bytes/s).
+    A range may wrap past midnight, a limit of 0 pauses downloads and an empty limit means unlimited."""
+    schedule = []
+    for part in text.replace(';', ',').split(','):
+        if not part.strip():
+            continue
+        try:
+            times, _, rate = part.partition('=')
+            start, end = (int(t.split(':')[0]) * 60 + int(t.split(':')[1]) for t in times.strip().split('-'))
+        except (ValueError, IndexError):
+            raise ValueError(f'Invalid schedule entry: {part.strip()}, expected HH:MM-HH:MM=RATE')
+        schedule.append((start, end, parse_rate(rate)))
+    return schedule
+
+
+class TokenBucket:
+    """Rate limiter for the download threads of one task. The progress hook reports the bytes received so far and
+    the calling thread sleeps while the bucket is in deficit. rate None is unlimited and 0 pauses the download."""
+    BURST_SECONDS = 1.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate: Union[float, None] = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.filename = None
+        self.downloaded = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate is None:
+            self.tokens = 0.0  # unlimited, forget any debt
+        elif self.rate:
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.rate * self.BURST_SECONDS)
+        self.updated = now
+
+    def set_rate(self, rate: Union[float, None]):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def consume(self, filename: str, downloaded: int):
+        with self.lock:
+            if filename != self.filename:  # next format or resumed download, only count bytes received from here
+                self.filename, self.downloaded = filename, downloaded
+                return
+            if downloaded <= self.downloaded:
+                return
+            self._refill()
+            self.tokens -= downloaded - self.downloaded
+            self.downloaded = downloaded
+        while True:  # wait in short steps so rate changes apply to threads that are already waiting
+            with self.lock:
+                self._refill()
+                if self.rate is None or self.tokens >= 0:
+                    return
+                wait = min(-self.tokens / self.rate, 0.5) if self.rate else 0.5
+            time.sleep(wait)
+
+
+class BandwidthManager:
+    """Spreads a global bandwidth limit over the running downloads in proportion to their priority weight,
+    without giving a task more than its own rate_limit (the rest goes to the other tasks).
+    A schedule of time of day ranges overrides the limit while one is active. Call rebalance() when tasks start or finish."""
+
+    def __init__(self, limit: Union[int, None] = None, schedule: list = None):
+        self.limit = limit
+        self.schedule = schedule or []
+
+    def current_limit(self) -> Union[int, None]:
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for start, end, limit in self.schedule:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return limit
+        return self.limit
+
+    def is_limited(self, task: 'Task') -> bool:
+        return task.rate_limit is not None or self.limit is not None or bool(self.schedule)
+
+    def rebalance(self, tasks: list['Task']):
+        remaining = self.current_limit()
+        # tasks whose own limit is below their share first, so what they leave over is split among the others
+        tasks = sorted(tasks, key=lambda t: (t.rate_limit if t.rate_limit is not None else float('inf')) / t.priority)
+        total_weight = sum(t.priority for t in tasks)
+        for task in tasks:
+            rate = task.rate_limit
+            if remaining is not None:
+                share = remaining * task.priority / total_weight
+                rate = share if rate is None else min(rate, share)
+                remaining -= rate
+                total_weight -= task.priority
+            task.bucket.set_rate(rate)
+
+
+class TaskLogger:
+    """yt-dlp logger of a task: counts retries for the task's telemetry, messages only go to the debug log"""
+
+    def __init__(self, task: 'Task'):
+        self.task = task
+
+    def debug(self, msg: str):
+        if 'Retrying' in msg:  # e.g. '[download] Got error: HTTP Error 503. Retrying fragment 3 (1/10)...'
+            if 'Retrying fragment' in msg: self.task.fragment_retries += 1
+            else: self.task.retries += 1
+        logger.debug(msg)
+
+    info = debug
+
+    def warning(self, msg: str):
+        logger.debug(f'WARNING: {msg}')
+
+    def error(self, msg: str):
+        self.task.last_error = msg  # classified by the engine when the extraction or download fails
+        logger.debug(msg)
+
+
+def classify_error(message: Union[str, None]) -> Union[str, None]:
+    """Kind of a retryable error message, one of RETRYABLE_ERRORS, or None if retrying would not help"""
+    for kind, pattern in RETRYABLE_ERRORS.items():
+        if message and pattern.search(message):
+            return kind
+    return None
+
+
+class HostHealth:
+    """Circuit breaker per host, used by the Engine on the control thread. A retryable failure opens the circuit: the host
+    gets no new tasks for an exponential backoff with jitter, and the number of downloads allowed on it at once is halved.
+    Failures while it is open do not count again, as the running tasks all hit the same limit. Each success afterwards allows
+    one more download, until max_per_host is reached and the host is healthy again."""
+
+    def __init__(self):
+        self.base_delays = dict(BACKOFF_BASE)
+        self.max_delay = BACKOFF_MAX
+        self.hosts: dict[str, dict] = {}  # unhealthy host -> {'failures', 'paused_until', 'limit'}
+
+    def record_failure(self, host: str, kind: str, max_per_host: int) -> float:
+        """Returns the seconds until the host may be retried"""
+        now = time.time()
+        health = self.hosts.setdefault(host, {'failures': 0, 'paused_until': 0.0, 'limit': max_per_host})
+        if now < health['paused_until']:
+            return health['paused_until'] - now
+        health['failures'] += 1
+        health['limit'] = max(1, health['limit'] // 2)
+        delay = min(self.base_delays[kind] * 2 ** (health['failures'] - 1), self.max_delay) * random.uniform(0.5, 1.0)
+        health['paused_until'] = now + delay
+        logger.warning(f'{host}: {kind.replace("_", " ")}, pausing for {delay:.0f}s with at most {health["limit"]} download(s) at once')
+        return delay
+
+    def record_success(self, host: str, max_per_host: int):
+        health = self.hosts.get(host)
+        if health is None:
+            return
+        health['limit'] += 1
+        if health['limit'] >= max_per_host:
+            del self.hosts[host]
+
+    def is_paused(self, host: str, now: float) -> bool:
+        health = self.hosts.get(host)
+        return health is not None and now < health['paused_until']
+
+    def limit(self, host: str, max_per_host: int) -> int:
+        health = self.hosts.get(host)
+        return min(health['limit'], max_per_host) if health else max_per_host
+
+
+class Task:
+    """State of one queued download, independent of how it is displayed.
+    Progress and status are written by worker threads with single attribute assignments (no locks) and read by the client.
+    Slotted since long queues keep thousands of these, and the ydl_opts and info dicts are dropped once the task is done."""
+    __slots__ = ('url', 'path', 'ydl_opts', 'host', 'future', 'info', 'active', 'task_id', 'last_persisted', 'check_archive', 'archive_format',
+                 'video_keys', 'transcode', 'filepath', 'media_duration', 'progress_slot', 'transcode_slot', 'priority', 'rate_limit', 'bucket',
+                 'status_slot', 'started_at', 'bytes_done', 'state', 'created_at', 'extract_started_at', 'extract_finished_at', 'slot_at',
+                 'first_byte_at', 'download_finished_at', 'finished_at', 'pp_started_at', 'postprocessing_time', 'peak_speed', 'retries',
+                 'fragment_retries', 'title', 'duration', 'size', 'formats', 'attempts', 'not_before', 'last_error',
+                 'disk_needs', 'reserve_file', 'reserve_target', 'reserve_held', 'archive_key')
+
+    def __init__(self, url: str, path: str, ydl_opts: dict, summary: dict = None, extracted_info: dict = None, task_id: int = None,
+                 check_archive: bool = True, archive_key: tuple[str, str] = None):
+        self.url = url
+        self.path = path
+        self.ydl_opts = ydl_opts
+        self.host = urllib.parse.urlparse(url).netloc.lower()
+        self.future = None
+        self.info = extracted_info  # full sanitized info dict, reused for download so the extractor only runs once
+        self.active = False  # holds a download slot (extracting before download or downloading)
+        self.task_id = task_id if task_id is not None else queue_store.add(url, path, ydl_opts)  # restored tasks are already stored
+        self.last_persisted = 0
+        self.check_archive = check_archive  # skip the task if it is in the download archive, False when the user picked it explicitly
+        self.archive_format = archive_format(ydl_opts)
+        self.video_keys = set()  # download archive keys, filled in when the download finishes
+        # video_key() of the task, resolved by the engine off the control thread unless the caller or the info dict knows it
+        self.archive_key = archive_key or (known_video_key(extracted_info) if extracted_info else None)
+        # FFmpegExtractAudio is run by the transcode pool after the download instead of inline on the download thread
+        postprocessors = ydl_opts.get('postprocessors') or []
+        self.transcode = next((pp for pp in postprocessors if pp.get('key') == 'FFmpegExtractAudio'), None)
+        if self.transcode: self.ydl_opts['postprocessors'] = [pp for pp in postprocessors if pp is not self.transcode]
+        self.filepath = None  # downloaded file, input of the conversion
+        self.media_duration = None
+        self.ydl_opts['progress_hooks'] = [self.progress_hook]
+        self.ydl_opts['postprocessor_hooks'] = [self.postprocessor_hook]
+        self.ydl_opts['logger'] = TaskLogger(self)
+        self.progress_slot = None  # (downloaded_bytes, total_bytes, speed, eta)
+        self.transcode_slot = None  # (fraction converted,)
+        self.priority = PRIORITY_WEIGHTS['Normal']
+        self.rate_limit = None  # bytes/s for this task alone, None for no limit besides the global one
+        self.bucket = TokenBucket()
+        self.status_slot = ('Queued - Waiting to extract info...',)
+        self.started_at = None
+        self.bytes_done = 0  # sum of finished formats, only written by the download thread
+        self.state = QUEUED  # only changed with set_state on the control thread
+        self.attempts = 0  # times the task was queued again after a retryable error
+        self.not_before = 0.0  # time.time() before which the task is not started again
+        self.last_error = None  # last error reported by yt-dlp during the current attempt
+        self.disk_needs = {}  # bytes reserved per volume while admitted, {device id: [directory, bytes]}, see Engine.admit
+        self.reserve_file = None  # placeholder holding the reserved space, see Engine.preallocate
+        self.reserve_target = 0  # size the placeholder was last asked to have
+        self.reserve_held = 0  # size it has, written by the disk thread
+
+        # telemetry, time.time() of each phase, see telemetry()
+        self.created_at = time.time()
+        self.extract_started_at = None
+        self.extract_finished_at = None
+        self.slot_at = None
+        self.first_byte_at = None
+        self.download_finished_at = None
+        self.finished_at = None
+        self.pp_started_at = None
+        self.postprocessing_time = 0.0  # yt-dlp's postprocessors and the transcode pool
+        self.peak_speed = 0
+        self.retries = 0
+        self.fragment_retries = 0
+
+        self.title = None
+        self.duration = None
+        self.size = 0
+        self.formats = {'video': None, 'audio': None}
+        if summary:
+            self.title = summary.get('title', 'Unknown Title')
+            self.duration = summary.get('duration_string', 'Unknown Duration')
+            self.size = summary.get('filesize', summary.get('filesize_approx', 0))
+            self.formats = summary.get('formats', {})
+            self.state = EXTRACTED
+            self.post_status('Ready to download')
+
+    def progress_hook(self, d: dict):
+        # Called on the download thread for every chunk, so only store raw numbers here
+        if d['status'] == 'downloading':
+            self.progress_slot = (d.get('downloaded_bytes') or 0, d.get('total_bytes') or d.get('total_bytes_estimate') or 0, d.get('speed'), d.get('eta'))
+            if self.first_byte_at is None and d.get('downloaded_bytes'): self.first_byte_at = time.time()
+            if (d.get('speed') or 0) > self.peak_speed: self.peak_speed = d['speed']
+            self.bucket.consume(d.get('filename'), d.get('downloaded_bytes') or 0)  # may sleep to keep to the bandwidth limit
+        elif d['status'] == 'finished':  # fires once per downloaded format, slot is only released when download() returns
+            self.bytes_done += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            self.filepath = d.get('filename') or self.filepath
+            self.media_duration = (d.get('info_dict') or {}).get('duration') or self.media_duration
+            self.post_status('Finished')
+        elif d['status'] == 'error':
+            self.post_status('Download error')
+
+    def postprocessor_hook(self, d: dict):
+        if d['status'] == 'started' or d['status'] == 'processing':
+            if d['status'] == 'started': self.pp_started_at = time.time()
+            self.post_status('Post-processing')
+        else:
+            if self.pp_started_at: self.postprocessing_time += time.time() - self.pp_started_at
+            self.pp_started_at = None
+            if d.get('postprocessor') == 'MoveFiles' and self.filepath:  # downloaded to the scratch directory, now in its final place
+                self.filepath = os.path.join(d['info_dict'].get('__finaldir') or os.path.dirname(self.filepath), os.path.basename(self.filepath))
+            self.post_status('Finished')
+
+    @property
+    def bytes_written(self) -> int:
+        return self.bytes_done + (self.progress_slot[0] if self.progress_slot and self.state == DOWNLOADING else 0)
+
+    def set_state(self, state: str):
+        if state not in TASK_TRANSITIONS[self.state]:
+            raise ValueError(f'Task {self.task_id} cannot go from {self.state} to {state}')
+        self.state = state
+
+    @property
+    def done(self) -> bool:
+        return self.state in (FINISHED, FAILED)
+
+    def telemetry(self) -> dict:
+        """Where the time of this task went, in seconds (None for phases that did not happen yet), and its throughput in bytes/s"""
+        def span(start: Union[float, None], end: Union[float, None]) -> Union[float, None]:
+            return round(end - start, 3) if start and end else None
+
+        download_time = span(self.started_at, self.download_finished_at)
+        return {'task_id': self.task_id, 'title': self.title or self.url, 'url': self.url, 'state': self.state,
+                'extraction_s': span(self.extract_started_at, self.extract_finished_at),
+                'queue_wait_s': span(self.created_at, self.slot_at),
+                'ttfb_s': span(self.started_at, self.first_byte_at),
+                'download_s': download_time,
+                'avg_bytes_per_s': round(self.bytes_done / download_time) if download_time else None,
+                'peak_bytes_per_s': round(self.peak_speed) if self.peak_speed else None,
+                'retries': self.retries, 'fragment_retries': self.fragment_retries,
+                'postprocessing_s': round(self.postprocessing_time, 3),
+                'total_s': span(self.created_at, self.finished_at),
+                'bytes': self.bytes_done}
+
+    def release(self):
+        """Drop what is only needed while the task runs, its options also reference the task through the hooks"""
+        self.ydl_opts = None
+        self.info = None
+        self.bucket = None
+        self.future = None
+
+    def transcode_progress(self, fraction: float):
+        self.transcode_slot = (fraction,)
+
+    def post_status(self, text: str):
+        """Thread-safe status update, a new tuple each time so repeating the same text still gets applied"""
+        self.status_slot = (text,)
+
+
+class Engine:
+    """Queue and scheduler for Tasks. Fills a number of download slots in queue order with a per-host cap,
+    and prefetches info for the next few queued tasks on a separate extraction pool.
+    Queue state is only changed on the control thread: worker threads hand results over through call_soon,
+    which is root.after for the GUI and an internal queue processed by run_until_complete when headless.
+    Listeners are called on the control thread as listener(task, event) with event one of
+    'added', 'extracting', 'extracted', 'extract_failed', 'started', 'retrying', 'transcoding' and 'done'.
+    Tasks failing with a retryable error (see classify_error) are queued again after their host's backoff, see HostHealth.
+    Downloads that convert audio hand the file to the transcode pool and give their slot to the next task;
+    while TRANSCODE_BACKLOG conversions are pending, only tasks that need no conversion are started.
+    Tasks move through the states in TASK_TRANSITIONS and leave tasks once downloaded, while converting they are in transcoding.
+    Extracted tasks are only started when their volume has room for them next to what running tasks still have to write, see admit."""
+
+    def __init__(self, call_soon: Callable = None, max_downloads: int = 3, max_per_host: int = 2):
+        self.tasks: dict[int, Task] = {}  # queued and downloading tasks by task_id, in queue order
+        self.bandwidth = BandwidthManager()
+        self.hosts = HostHealth()
+        self.max_downloads = max_downloads
+        self.max_per_host = max_per_host
+        self.prefetch_ahead = PREFETCH_AHEAD
+        self.listeners: list[Callable[[Task, str], None]] = []
+        self.finished = 0
+        self.failed = 0
+        self.transcoding: list[Task] = []
+        self.skipped = 0
+        self.history: collections.deque[dict] = collections.deque(maxlen=TELEMETRY_HISTORY)  # telemetry of finished tasks
+        self.max_transcode_backlog = TRANSCODE_BACKLOG
+        self._resolving_keys: set[int] = set()  # task_ids whose archive key is being resolved, see resolve_archive_keys
+        self.scratch_dir = None  # directory for .part files, fragments and merge inputs, None for the download directory
+        self.preallocate = False  # hold the space of admitted tasks with a placeholder file, so other programs can't take it
+        self.disk_headroom = DISK_HEADROOM
+        self._calls = queue.SimpleQueue()
+        self.call_soon = call_soon or (lambda func, *args: self._calls.put((func, args)))
+
+    def _emit(self, task: Task, event: str):
+        for listener in self.listeners:
+            listener(task, event)
+
+    def add(self, task: Task) -> Task:
+        self.tasks[task.task_id] = task
+        self._emit(task, 'added')
+        return task
+
+    def restore(self) -> list[Task]:
+        """Re-create tasks saved by a previous session. Downloads continue from their .part files,
+        and tasks that were converting go straight back to the transcode pool if their downloaded file is still there."""
+        tasks = []
+        for row in queue_store.load():
+            ydl_opts = row['ydl_opts']
+            ydl_opts['continuedl'] = True
+            task = Task(row['url'], row['path'], ydl_opts, task_id=row['id'])
+            task.title = row['title']
+            for directory in {row['path'], self.scratch_dir or row['path']}:  # placeholder left behind if the last session crashed
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(directory, f'{RESERVE_FILE_PREFIX}{task.task_id}'))
+            if row['state'] == 'transcoding' and task.transcode and row['filepath'] and os.path.exists(row['filepath']):
+                task.filepath = row['filepath']
+                task.check_archive = False  # archive keys are resolved by _transcode, off the control thread
+                tasks.append(self.add(task))
+                del self.tasks[task.task_id]  # downloaded already, tasks only holds what still has to download
+                self.start_transcode(task)
+                continue
+            if row['bytes_done']: task.post_status(f'Queued - Resuming after {format_bytes(row["bytes_done"])}')
+            queue_store.update(row['id'], state='queued')
+            tasks.append(self.add(task))
+        if tasks: logger.info(f'Restored {len(tasks)} task(s) from previous session')
+        return tasks
+
+    @property
+    def active_count(self) -> int:
+        return sum(1 for t in self.tasks.values() if t.active)
+
+    def skip_archived(self):
+        """Finish tasks whose video is already in the download archive without extracting anything.
+        Tasks whose archive key is not known yet wait for resolve_archive_keys, matching URLs to extractors takes a while."""
+        self.resolve_archive_keys()
+        for task in list(self.tasks.values()):
+            if not task.check_archive or task.archive_key is None:
+                continue
+            task.check_archive = False  # checked once, before anything runs
+            if task.state in (QUEUED, EXTRACTED) and not task.active and download_archive.contains(task.archive_key, task.archive_format):
+                del self.tasks[task.task_id]
+                queue_store.remove(task.task_id)
+                task.set_state(FINISHED)
+                task.release()
+                self.skipped += 1
+                task.post_status('Already downloaded, skipped')
+                self._emit(task, 'done')
+
+    def resolve_archive_keys(self):
+        """Work out the archive keys of tasks to check against the download archive on the extraction pool, in queue order"""
+        tasks = [t for t in self.tasks.values() if t.check_archive and t.archive_key is None and t.task_id not in self._resolving_keys]
+        if tasks:
+            self._resolving_keys.update(t.task_id for t in tasks)
+            extraction_executor.submit(self._resolve_archive_keys, tasks)
+
+    def _resolve_archive_keys(self, tasks: list[Task]):
+        for i in range(0, len(tasks), ARCHIVE_KEY_BATCH):  # the first tasks can start while the rest are resolved
+            self.call_soon(self._on_archive_keys, [(task, video_key(task.url)) for task in tasks[i:i + ARCHIVE_KEY_BATCH]])
+
+    def _on_archive_keys(self, keys: list[tuple[Task, tuple[str, str]]]):
+        for task, key in keys:
+            self._resolving_keys.discard(task.task_id)
+            task.archive_key = key
+        self.dispatch()
+
+    def dispatch(self):
+        """Fill free download slots with the next eligible tasks in queue order, respecting the per-host cap,
+        then prefetch info for the next few queued tasks so they can start as soon as a slot frees up"""
+        self.skip_archived()
+        now = time.time()
+        active = [t for t in self.tasks.values() if t.active]
+        host_counts = collections.Counter(t.host for t in active)
+        for task in list(self.tasks.values()):
+            if len(active) >= self.max_downloads:
+                break
+            if task.active or task.check_archive or task.not_before > now or self.hosts.is_paused(task.host, now):
+                continue  # check_archive: its archive key is still being resolved
+            if host_counts[task.host] >= self.hosts.limit(task.host, self.max_per_host):
+                continue
+            if task.transcode and len(self.transcoding) >= self.max_transcode_backlog:
+                continue  # conversions are falling behind, don't add to them
+            if task.state == EXTRACTED and not self.admit(task):
+                continue  # waiting for disk space, smaller tasks behind it may still fit
+            task.active = True
+            if task.slot_at is None: task.slot_at = time.time()
+            active.append(task)
+            host_counts[task.host] += 1
+            if task.state == EXTRACTING:
+                continue  # being prefetched, will start download once extracted
+            elif task.state == QUEUED:
+                self.start_extraction(task)  # will start download once extracted
+            else:
+                self.start_download(task)
+
+        prefetching = sum(1 for t in self.tasks.values() if t.state == EXTRACTING and not t.active)
+        for task in self.tasks.values():
+            if prefetching >= self.prefetch_ahead:
+                break
+            if not task.active and not task.check_archive and task.state == QUEUED and task.not_before <= now and not self.hosts.is_paused(task.host, now):
+                self.start_extraction(task)
+                prefetching += 1
+
+    def rebalance_bandwidth(self):
+        self.bandwidth.rebalance([t for t in self.tasks.values() if t.active and t.future])
+
+    def poll(self):
+        """Periodic housekeeping on the control thread: dispatch, apply bandwidth limits and save download progress"""
+        self.dispatch()
+        self.rebalance_bandwidth()  # picks up priority, limit and schedule changes
+        now = time.time()
+        for task in self.tasks.values():
+            if task.active and task.progress_slot and now - task.last_persisted > 5:
+                task.last_persisted = now
+                queue_store.update(task.task_id, bytes_done=task.bytes_done + task.progress_slot[0])
+            if task.reserve_file:  # give back what the download has written by now, and all of it to the merger
+                need = next(iter(task.disk_needs.values()))[1]  # the volume yt-dlp writes to comes first
+                size = 0 if task.pp_started_at else max(need - task.bytes_written, 0)
+                if size < task.reserve_target - RESERVE_SHRINK_STEP or (size == 0 < task.reserve_target):
+                    task.reserve_target = size
+                    disk_executor.submit(self._resize_reserve_file, task, task.reserve_file, size, False)
+
+    def start_extraction(self, task: Task):
+        task.set_state(EXTRACTING)
+        task.last_error = None
+        task.extract_started_at = time.time()
+        task.post_status('Extracting info...')
+        queue_store.update(task.task_id, state='extracting')
+        self._emit(task, 'extracting')
+        extraction_executor.submit(self._extract, task)
+
+    def _extract(self, task: Task):
+        info = extract_info(task.url, task.ydl_opts, info=task.info)
+        self.call_soon(self._on_extracted, task, info)
+
+    def _on_extracted(self, task: Task, info: dict):
+        task.extract_finished_at = time.time()
+        if not info and self.retry_later(task):
+            return
+        if not info:
+            task.active = False
+            task.set_state(FAILED)
+            task.finished_at = time.time()
+            del self.tasks[task.task_id]
+            queue_store.remove(task.task_id)
+            self.history.append(task.telemetry())
+            task.release()
+            task.post_status(f'Failed to extract info: {task.last_error.removeprefix("ERROR: ")}' if task.last_error else 'Failed to extract info')
+            self.failed += 1
+            self._emit(task, 'extract_failed')
+            self.dispatch()
+            return
+
+        task.info = info
+        task.archive_key = task.archive_key or known_video_key(info)
+        parsed_info = parse_info(info)
+        task.title = sanitize(parsed_info['title'])
+        task.duration = parsed_info['duration']
+        task.size = parsed_info['size']
+        task.formats = parsed_info['formats']
+        task.set_state(EXTRACTED)
+        task.post_status('Ready to download')
+        queue_store.update(task.task_id, state='extracted', title=task.title)
+        self._emit(task, 'extracted')
+        if task.active and self.admit(task):  # slot was reserved by the scheduler during extraction, download right away
+            self.start_download(task)
+        else:  # prefetched, or waiting for disk space, a slot may already be free
+            task.active = False
+            self.dispatch()
+
+    def disk_reserved(self) -> collections.Counter:
+        """Bytes per volume that admitted tasks have yet to write, less what their placeholder files already took from the free space"""
+        reserved = collections.Counter()
+        for task in (*self.tasks.values(), *self.transcoding):
+            if task.disk_needs:
+                written = task.bytes_written
+                for index, (device, (_, need)) in enumerate(task.disk_needs.items()):
+                    held = task.reserve_held if index == 0 else 0  # placeholders are on the volume yt-dlp writes to, the first one
+                    reserved[device] += max(need - written - held, 0)
+        return reserved
+
+    def admit(self, task: Task) -> bool:
+        """Reserve the disk space an extracted task needs before it starts: its estimated size, times DISK_OVERHEAD_FACTOR
+        where formats are merged or converted, on the scratch volume and the size of the result on the download volume.
+        False when a volume has not enough free space besides the other reservations and disk_headroom, the task then waits.
+        Tasks of unknown size, or on a volume whose free space can't be read, are always admitted."""
+        if task.disk_needs:
+            return True
+        formats = selected_formats(task.info, task.ydl_opts.get('format')) if task.info else []
+        size = estimate_download_size(task.info, formats) if task.info else task.size or 0
+        if not size:
+            return True
+        merged = len(formats) > 1
+        try:
+            work_device, work_dir = volume_of(self.scratch_dir or task.path)
+            needs = {work_device: [work_dir, int(size * (DISK_OVERHEAD_FACTOR if merged or task.transcode else 1))]}
+            device, directory = volume_of(task.path)
+            if device != work_device:  # the finished file is moved over, and converted there
+                needs[device] = [directory, int(size * (DISK_OVERHEAD_FACTOR if task.transcode else 1))]
+            free = {device: shutil.disk_usage(directory).free for device, (directory, _) in needs.items()}
+        except OSError as e:  # e.g. the drive of a restored task is gone, the download reports the actual error
+            logger.warning(f'{task.title or task.url}: cannot check free disk space: {e}')
+            return True
+        reserved = self.disk_reserved()
+        for device, (directory, need) in needs.items():
+            available = free[device] - reserved[device] - self.disk_headroom
+            if need > available:
+                if not task.status_slot[0].startswith('Waiting for disk space'):
+                    logger.warning(f'{task.title or task.url}: waiting for {format_bytes(need)} of disk space in {directory}')
+                task.post_status(f'Waiting for disk space: needs {format_bytes(need)}, {format_bytes(max(available, 0))} available in {directory}')
+                return False
+        task.disk_needs = needs
+        if self.preallocate:
+            task.reserve_file = os.path.join(work_dir, f'{RESERVE_FILE_PREFIX}{task.task_id}')
+            task.reserve_target = needs[work_device][1]
+            disk_executor.submit(self._resize_reserve_file, task, task.reserve_file, task.reserve_target, True)
+        return True
+
+    @staticmethod
+    def _resize_reserve_file(task: Task, path: str, size: int, create: bool):
+        """Runs on the disk thread. Placeholders that could not be created are dropped, the task's needs stay accounted for."""
+        try:
+            if create or os.path.exists(path):
+                reserve_space(path, size)
+                task.reserve_held = size
+        except OSError as e:
+            logger.warning(f'Could not reserve disk space for {task.title or task.url}: {e}')
+            task.reserve_held = 0
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    @staticmethod
+    def _remove_reserve_file(task: Task, path: str):
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        task.reserve_held = 0
+
+    def release_disk(self, task: Task):
+        task.disk_needs = {}
+        self.drop_reserve_file(task)
+
+    def drop_reserve_file(self, task: Task):
+        """Give the space held for the task back, its needs stay accounted for in disk_reserved"""
+        if task.reserve_file:
+            disk_executor.submit(self._remove_reserve_file, task, task.reserve_file)
+            task.reserve_file = None
+            task.reserve_target = 0
+
+    def start_download(self, task: Task):
+        task.set_state(DOWNLOADING)
+        task.last_error = None
+        task.active = True
+        task.started_at = time.time()
+        task.bytes_done = 0
+        task.post_status('Starting download...')
+        if self.bandwidth.is_limited(task):
+            task.ydl_opts.update(noresizebuffer=True, buffersize=THROTTLED_BLOCK_SIZE)
+        if self.scratch_dir:
+            use_scratch_dir(task.ydl_opts, task.path, self.scratch_dir)
+        queue_store.update(task.task_id, state='downloading')
+        task.future = download_executor.submit(download, task.url, task.ydl_opts, False, task.info)
+        task.future.add_done_callback(lambda f: self.call_soon(self._on_download_done, task, f))
+        self.rebalance_bandwidth()
+        self._emit(task, 'started')
+
+    def _on_download_done(self, task: Task, future: concurrent.futures.Future):
+        """Runs on the control thread once download() (including post-processing) has returned"""
+        task.active = False
+        succeeded = future.exception() is None and bool(future.result())
+        if not succeeded and self.retry_later(task):
+            return
+        task.download_finished_at = time.time()
+        task.video_keys = {task.archive_key or video_key(task.url)}
+        if task.info and known_video_key(task.info):
+            task.video_keys.add(known_video_key(task.info))
+        task.info = None  # no longer needed, can be large
+        self.tasks.pop(task.task_id, None)
+        self.rebalance_bandwidth()  # its share goes to the remaining downloads
+        if succeeded: self.hosts.record_success(task.host, self.max_per_host)
+        if succeeded and task.transcode and task.filepath:
+            self.drop_reserve_file(task)  # the conversion writes into the space it held
+            self.start_transcode(task)
+        else:
+            queue_store.remove(task.task_id)
+            self._finish(task, succeeded)
+        self.dispatch()  # a slot just freed up, start the next task now instead of waiting for next poll
+
+    def retry_later(self, task: Task) -> bool:
+        """Queue a task whose extraction or download just failed again, if its error is retryable and it has attempts left.
+        Its host is backed off, so the other tasks of the host wait as well instead of failing one after another."""
+        kind = classify_error(task.last_error)
+        if kind is None or task.attempts + 1 >= MAX_TASK_ATTEMPTS:
+            return False
+        task.attempts += 1
+        self.release_disk(task)
+        delay = self.hosts.record_failure(task.host, kind, self.max_per_host)
+        task.not_before = time.time() + delay
+        task.active = False
+        task.set_state(QUEUED)
+        if kind == 'forbidden':  # media URLs are likely stale, extract again
+            task.info = None
+            metadata_cache.discard(task.url, task.ydl_opts)
+        task.post_status(f'{kind.replace("_", " ").capitalize()}, retrying in {delay:.0f}s (attempt {task.attempts + 1} of {MAX_TASK_ATTEMPTS})')
+        queue_store.update(task.task_id, state='queued')
+        self.rebalance_bandwidth()
+        self._emit(task, 'retrying')
+        self.dispatch()
+        return True
+
+    def start_transcode(self, task: Task):
+        task.set_state(POSTPROCESSING)
+        self.transcoding.append(task)
+        queue_store.update(task.task_id, state='transcoding', filepath=task.filepath)
+        task.post_status(f'Queued for conversion to {task.transcode["preferredcodec"]}')
+        future = transcode_executor.submit(self._transcode, task)
+        future.add_done_callback(lambda f: self.call_soon(self._on_transcode_done, task, f))
+        self._emit(task, 'transcoding')
+
+    def _transcode(self, task: Task) -> str:
+        task.post_status(f'Converting to {task.transcode["preferredcodec"]}...')
+        t0 = time.time()
+        if not task.video_keys:  # restored from a previous session, which saved no archive keys
+            task.video_keys = {task.archive_key or video_key(task.url)}
+        try:
+            return transcode_audio(task.filepath, task.transcode['preferredcodec'], task.transcode.get('preferredquality'),
+                                   task.ydl_opts.get('ffmpeg_location'), task.media_duration, task.transcode_progress)
+        finally:
+            task.postprocessing_time += time.time() - t0
+
+    def _on_transcode_done(self, task: Task, future: concurrent.futures.Future):
+        self.transcoding.remove(task)
+        queue_store.remove(task.task_id)
+        if future.exception() is not None:
+            logger.error(f'{task.title or task.url}: {future.exception()}')
+        else:
+            task.filepath = future.result()
+        self._finish(task, future.exception() is None)
+        self.dispatch()  # a task held back by the conversion backlog may be able to start
+
+    def _finish(self, task: Task, succeeded: bool):
+        task.set_state(FINISHED if succeeded else FAILED)
+        task.finished_at = time.time()
+        self.release_disk(task)
+        self.history.append(task.telemetry())
+        if not succeeded:
+            self.failed += 1
+            task.post_status('Conversion error' if task.transcode and task.filepath else 'Download error')
+        else:
+            self.finished += 1
+            download_archive.add(task.video_keys, task.archive_format, task.url, task.filepath)
+            if task.bytes_done:
+                elapsed = max(time.time() - task.started_at, 0.001)
+                connections = task.ydl_opts.get('concurrent_fragment_downloads', 1)
+                task.post_status(f'Finished: {format_bytes(task.bytes_done)} in {elapsed:.1f}s '
+                                 f'({format_bytes(task.bytes_done / elapsed)}/s avg, {connections} connection(s) per stream)')
+        task.release()
+        self._emit(task, 'done')
+
+    def telemetry(self) -> list[dict]:
+        """Telemetry of the last finished tasks and of every task still in progress, oldest first"""
+        return [*self.history, *(t.telemetry() for t in self.transcoding), *(t.telemetry() for t in self.tasks.values())]
+
+    def run_until_complete(self, poll_interval: float = 0.5):
+        """Process the queue on the calling thread until it is empty, for clients without their own event loop"""
+        self.dispatch()
+        while self.tasks or self.transcoding:
+            try:
+                func, args = self._calls.get(timeout=poll_interval)
+                func(*args)
+            except queue.Empty:
+                self.poll()
+
+
+TELEMETRY_FIELDS = ('task_id', 'title', 'url', 'state', 'extraction_s', 'queue_wait_s', 'ttfb_s', 'download_s', 'avg_bytes_per_s',
+                    'peak_bytes_per_s', 'retries', 'fragment_retries', 'postprocessing_s', 'total_s', 'bytes')
+
+
+def write_telemetry_csv(rows: list[dict], path: str):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=TELEMETRY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def prometheus_metrics(engine: 'Engine') -> str:
+    """Engine state and per-task telemetry in the Prometheus text exposition format"""
+    def label(value: Any) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    lines = ['# TYPE ytdlp_gui_tasks gauge']
+    states = collections.Counter(t.state for t in (*engine.tasks.values(), *engine.transcoding))
+    lines += [f'ytdlp_gui_tasks{{state="{state}"}} {states[state]}' for state in (QUEUED, EXTRACTING, EXTRACTED, DOWNLOADING, POSTPROCESSING)]
+    now = time.time()
+    lines.append('# TYPE ytdlp_gui_host_paused gauge')
+    lines += [f'ytdlp_gui_host_paused{{host="{label(host)}"}} {int(engine.hosts.is_paused(host, now))}' for host in engine.hosts.hosts]
+    lines.append('# TYPE ytdlp_gui_host_download_limit gauge')
+    lines += [f'ytdlp_gui_host_download_limit{{host="{label(host)}"}} {engine.hosts.limit(host, engine.max_per_host)}' for host in engine.hosts.hosts]
+    for name, value in (('finished', engine.finished), ('failed', engine.failed), ('skipped', engine.skipped),
+                        ('metadata_cache_hits', metadata_cache.hits), ('metadata_cache_misses', metadata_cache.misses),
+                        ('ydl_instances_reused', ydl_pool.reused), ('ydl_instances_created', ydl_pool.created)):
+        lines += [f'# TYPE ytdlp_gui_{name}_total counter', f'ytdlp_gui_{name}_total {value}']
+    per_task = {'extraction_s': 'extraction_seconds', 'queue_wait_s': 'queue_wait_seconds', 'ttfb_s': 'time_to_first_byte_seconds',
+                'download_s': 'download_seconds', 'postprocessing_s': 'postprocessing_seconds', 'total_s': 'total_seconds',
+                'avg_bytes_per_s': 'average_throughput_bytes_per_second', 'peak_bytes_per_s': 'peak_throughput_bytes_per_second',
+                'retries': 'retries', 'fragment_retries': 'fragment_retries', 'bytes': 'downloaded_bytes'}
+    rows = engine.telemetry()
+    for field, name in per_task.items():
+        metric = f'ytdlp_gui_task_{name}'
+        lines.append(f'# TYPE {metric} gauge')
+        lines += [f'{metric}{{task="{row["task_id"]}",title="{label(row["title"])}",state="{row["state"]}"}} {row[field]}'
+                  for row in rows if row[field] is not None]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves prometheus_metrics() at http://127.0.0.1:port/metrics. The metrics are built on the engine's control
+    thread through call_soon, so they never see the queue half-changed."""
+
+    def __init__(self, engine: 'Engine', port: int = METRICS_PORT):
+        metrics_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                try:
+                    body = metrics_server.collect().encode()
+                except concurrent.futures.TimeoutError:
+                    self.send_error(503, 'Engine is busy')
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.engine = engine
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        logger.info(f'Serving metrics at http://127.0.0.1:{self.server.server_port}/metrics')
+
+    def collect(self) -> str:
+        future = concurrent.futures.Future()
+        self.engine.call_soon(lambda: future.set_result(prometheus_metrics(self.engine)))
+        return future.result(timeout=5)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv: list = None) -> int:
+    """Headless entry point: download every given URL (playlists are expanded) with the same scheduler as the GUI"""
+    parser = argparse.ArgumentParser(prog='yt-dlp-gui --headless', description='Download URLs with the YT-DLP GUI engine without opening a window.')
+    parser.add_argument('urls', nargs='*', help='video or playlist URLs')
+    parser.add_argument('-a', '--batch-file', help='file with one URL per line, "-" for stdin')
+    parser.add_argument('-o', '--output', default=os.path.join(os.path.expanduser('~'), 'Downloads'), help='download directory')
+    parser.add_argument('-x', '--audio', action='store_true', help='download best audio only')
+    parser.add_argument('-j', '--concurrent', type=int, default=3, help='number of concurrent downloads')
+    parser.add_argument('--per-site', type=int, default=2, help='maximum concurrent downloads per site')
+    parser.add_argument('--profile', choices=list(PERFORMANCE_PROFILES), default='Standard', help='performance profile')
+    parser.add_argument('--resume', action='store_true', help='also resume tasks left unfinished by a previous session')
+    parser.add_argument('--force', action='store_true', help='download again even if a video is in the download archive')
+    parser.add_argument('-r', '--limit-rate', default='', help='bandwidth limit shared by all downloads, e.g. 2M')
+    parser.add_argument('--task-limit-rate', default='', help='bandwidth limit of each download, e.g. 500K')
+    parser.add_argument('--metrics-port', type=int, help=f'serve Prometheus metrics at http://127.0.0.1:PORT/metrics (e.g. {METRICS_PORT})')
+    parser.add_argument('--telemetry-csv', help='write per-task timings and throughput to this CSV file when done')
+    parser.add_argument('--schedule', default='', help='time of day limits overriding --limit-rate, e.g. "09:00-17:00=500K,22:00-06:00="')
+    parser.add_argument('--cookies-from-browser', metavar='BROWSER', help='sign in with the cookies of BROWSER[:PROFILE], read once for all downloads')
+    parser.add_argument('--scratch-dir', help='directory for partial downloads, fragments and merge inputs, e.g. on a faster or larger disk')
+    parser.add_argument('--preallocate', action='store_true', help='hold the disk space of running downloads with a placeholder file')
+    parser.add_argument('--min-free', default='', help=f'free space downloads never use, e.g. 2G (default {DISK_HEADROOM // 2 ** 20}M)')
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.batch_file:
+        with (sys.stdin if args.batch_file == '-' else open(args.batch_file, encoding='utf-8')) as f:
+            urls += [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    apply_performance_profile(ydl_base_opts, args.profile)
+    if args.cookies_from_browser: ydl_base_opts['cookiesfrombrowser'] = args.cookies_from_browser.split(':', 1)
+    mode = 'audio_best' if args.audio else 'video_best'
+    engine = Engine(max_downloads=max(1, min(MAX_DOWNLOAD_WORKERS, args.concurrent)), max_per_host=max(1, args.per_site))
+    try:
+        engine.bandwidth.limit = parse_rate(args.limit_rate)
+        engine.bandwidth.schedule = parse_schedule(args.schedule)
+        task_rate_limit = parse_rate(args.task_limit_rate)
+        if args.min_free: engine.disk_headroom = parse_rate(args.min_free)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def log_event(task: Task, event: str):
+        if event == 'added':
+            task.rate_limit = task_rate_limit
+        elif event == 'started':
+            logger.log(15, f'Downloading {task.title or task.url}')
+        elif event in ('done', 'extract_failed', 'retrying'):
+            logger.log(15, f'{task.title or task.url}: {task.status_slot[0]}')
+
+    engine.listeners.append(log_event)
+    engine.scratch_dir = args.scratch_dir
+    engine.preallocate = args.preallocate
+    if args.resume: engine.restore()
+    for url in urls:
+        if not is_valid_url(url):
+            logger.error(f'Skipping invalid URL: {url}')
+            continue
+        info = extract_flat_info(url)
+        if info.get('_type') == 'playlist' or 'entries' in info:
+            for entry in info.get('entries') or []:
+                if entry: engine.add(Task(get_entry_url(entry, url), args.output, build_ydl_opts(args.output, mode), check_archive=not args.force,
+                                          archive_key=known_video_key(entry)))
+        else:
+            engine.add(Task(url, args.output, build_ydl_opts(args.output, mode), extracted_info=info if 'formats' in info else None, check_archive=not args.force))
+    if not engine.tasks and not engine.transcoding:
+        parser.error('no URLs to download')
+    if args.metrics_port: MetricsServer(engine, args.metrics_port)
+    engine.run_until_complete()
+    if args.telemetry_csv: write_telemetry_csv(engine.telemetry(), args.telemetry_csv)
+    logger.log(15, f'Done: {engine.finished} finished, {engine.skipped} already downloaded, {engine.failed} failed')
+    return 1 if engine.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,17 @@
+import time
+
+startup_t0 = time.perf_counter()  # taken before the other imports so the startup benchmark covers them
+
+import bisect
+import concurrent.futures
 import copy
 import ctypes
+import json
 import logging
 import os
-import re
+import queue
 import sys
 import threading
-import urllib.parse
 from tkinter import *
 from tkinter import filedialog, messagebox
 from tkinter.ttk import *
@@ -13,64 +19,35 @@ from typing import Any, Callable, Union
 
 if sys.platform == 'win32':
     import winreg
+try:  # optional, enables dropping files and text on the import window
+    from tkinterdnd2 import DND_FILES, DND_TEXT, TkinterDnD
+except ImportError:
+    TkinterDnD = None
+
+import engine
+from engine import (DISK_HEADROOM, EXTRACTED, FINISHED, METRICS_PORT, MAX_DOWNLOAD_WORKERS, PERFORMANCE_PROFILES, PREFETCH_AHEAD, PRIORITY_WEIGHTS, Engine, FormatTable, MetricsServer, Task, apply_performance_profile, archive_format, browser_cookies, build_ydl_opts, download_archive,
+                    entry_video_key, extract_flat_info, extract_info, extraction_executor, filter_new_urls, format_bytes, format_selector, format_seconds, get_config_dir, get_entry_url, get_res_path, is_valid_url, metadata_cache, parse_info, parse_rate, parse_schedule,
+                    parse_url_list, queue_store, write_telemetry_csv, ydl_base_opts, ydl_pool)
 
-import yt_dlp
-from sanitize_filename import sanitize
+if '--headless' in sys.argv:
+    sys.exit(engine.main([arg for arg in sys.argv[1:] if arg != '--headless']))
 
 frozen = getattr(sys, 'frozen', False)  # frozen -> running in exe
-logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-logging.addLevelName(15, 'STATUS')  # between debug 10 and info 20
-logger.setLevel(15)
-download_queue = []
-ongoing_task: bool = False
-logger.info(f'YT-DLP GUI (yt-dlp {yt_dlp.version.__version__}) (Python {sys.version})')
+startup_milestones: dict[str, float] = {}  # milestone -> ms since startup_t0
+if frozen and hasattr(sys, '_MEIPASS'):  # one-file build: time from the bootloader creating _MEIPASS to this script starting
+    # st_ctime is the creation time on Windows, on other platforms it is when the last file was unpacked into it
+    meipass_created = getattr(os.stat(sys._MEIPASS), 'st_birthtime', os.stat(sys._MEIPASS).st_ctime)
+    startup_milestones['unpack'] = round((time.time() - (time.perf_counter() - startup_t0) - meipass_created) * 1000, 1)
 
 
-def get_res_path(relative_path: str) -> str:
-    """ Get absolute path to resource, works for dev and for PyInstaller
-     Relative path will always get extracted into root!"""
-    base_path = getattr(sys, '_MEIPASS', os.path.dirname(__file__))
-    if os.path.exists(os.path.join(base_path, relative_path)):
-        return os.path.join(base_path, relative_path)
-    else:
-        raise FileNotFoundError(f'{os.path.join(base_path, relative_path)} is not found!')
+def mark_startup(milestone: str):
+    startup_milestones[milestone] = round((time.perf_counter() - startup_t0) * 1000, 1)
 
 
-# Add deno to PATH
-try:
-    deno_exe = 'deno.exe' if sys.platform == 'win32' else 'deno'
-    deno_path = get_res_path(deno_exe)
-    os.environ["PATH"] += os.pathsep + os.path.dirname(deno_path)
-    logger.info(f'Found {deno_exe} at {deno_path}, added to PATH')
-except FileNotFoundError:
-    logger.warning('Deno not found! yt-dlp might fail on some sites.')
-
-ydl_base_opts: dict[str, Any] = {'outtmpl': '%(title)s.%(ext)s',
-                                 'restrictfilenames': True,
-                                 'nocheckcertificate': True,
-                                 'ignoreerrors': False,
-                                 'logtostderr': False,
-                                 'geo-bypass': True,
-                                 'quiet': True,
-                                 'no_warnings': True,
-                                 'default_search': 'auto',
-                                 'source_address': '0.0.0.0',
-                                 'windowsfilenames': True,
-                                 'overwrites': True,
-                                 'cachedir': False,
-                                 'age_limit': 100,
-                                 'noplaylist': False,
-                                 'live_from_start': True,
-                                 'no-video-multistreams': True,
-                                 'no-audio-multistreams': True,
-                                 'check_formats': 'selected',
-                                 'fixup': 'detect_or_warn',
-                                 'extractor_args': {'youtube': {'skip': ['dash', 'hls']}, },
-                                 'ffmpeg_location': get_res_path('ffmpeg.exe') if sys.platform == 'win32' else 'ffmpeg',
-                                 }
-percent_str_regex = re.compile(r'\d{1,3}\.\d{1,2}%')
-ansi_escape_regex = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+mark_startup('imports')
+logger = logging.getLogger(__name__)
+logger.setLevel(15)
+PROGRESS_REFRESH_MS = 100  # progress of all tasks is applied to the UI at most this often (10 Hz)
 
 
 def handle_private_video(e: object, url: str, ydl_opts: dict, func: Callable[[str, dict, bool], Union[dict, bool]]) -> Union[dict, bool]:
@@ -82,6 +59,7 @@ def handle_private_video(e: object, url: str, ydl_opts: dict, func: Callable[[st
         if v.get() == 0: return
         browser = [browsers[v.get() - 1]]  # yt_dlp expects a list
         ydl_opts['cookiesfrombrowser'] = browser
+        browser_cookies.invalidate(browser)  # the account may have been signed in since the cookies were read
         popup.title('Logging in...')
         choose_button_var.set('Logging in...')
         choose_button.configure(state=DISABLED)
@@ -90,7 +68,7 @@ def handle_private_video(e: object, url: str, ydl_opts: dict, func: Callable[[st
         if info:
             ydl_base_opts['cookiesfrombrowser'] = browser
             result = info
-            messagebox.showinfo('Login', 'Login successful! Specified browser will be used until you close this app. Browser will be asked again if you attempt to download another private video that the existing accounts in this browser cannot access.')
+            messagebox.showinfo('Login', 'Login successful! Specified browser will be used until you close this app, or after it too with "Remember browser login". Browser will be asked again if you attempt to download another private video that the existing accounts in this browser cannot access.')
         else:
             messagebox.showerror('Login', 'Login failed. The browser you chose does not have an account with access to this video.')
         popup.destroy()
@@ -110,56 +88,6 @@ def handle_private_video(e: object, url: str, ydl_opts: dict, func: Callable[[st
     return result
 
 
-def download(urls: Union[list, str], ydl_opts=None, ignore_error: bool = False) -> bool:
-    """Return whether download is successful"""
-    if ydl_opts is None: ydl_opts = copy.deepcopy(ydl_base_opts)
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download(urls if isinstance(urls, list) else [urls])
-    except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
-        if ignore_error: return False
-        return handle_private_video(e, urls, ydl_opts, download)
-    except Exception as e:
-        messagebox.showerror('Error', f'Error while downloading: {e}')
-        return False
-    else:
-        return True
-
-
-def extract_info(url: str, ydl_opts: dict, ignore_error: bool = False) -> dict:
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return ydl.sanitize_info(info)
-    except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
-        if ignore_error: return {}
-        result = handle_private_video(e, url, ydl_opts, extract_info)
-        if not result:
-            return {}
-        else:  # success
-            return result
-    except Exception as e:
-        messagebox.showerror('Error', f'Error while extracting info: {e}')
-        return {}
-
-
-def extract_flat_info(url: str) -> dict:
-    """Quickly extract playlist metadata without full format extraction.
-    Uses extract_flat='in_playlist' so only titles/IDs/durations are fetched.
-    For single videos, yt-dlp returns the normal info dict (no 'entries' key)."""
-    ydl_opts = copy.deepcopy(ydl_base_opts)
-    ydl_opts['extract_flat'] = 'in_playlist'
-    ydl_opts['quiet'] = True
-    ydl_opts['no_warnings'] = True
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return ydl.sanitize_info(info) if info else {}
-    except Exception as e:
-        logger.warning(f'Flat extraction failed: {e}')
-        return {}
-
-
 class ScrolledWindow(Frame):
     def __init__(self, parent, **kwargs):
         super().__init__(parent, **kwargs)
@@ -219,120 +147,167 @@ except:
     pass
 
 
-class DownloadTask(Frame):
-    def __init__(self, url: str, path: str, ydl_opts: dict, parent: Widget, info: dict = None):
-        super().__init__(parent, borderwidth=2, relief='groove')
-        self.url = url
-        self.path = path
-        self.parent = parent
-        self.ydl_opts = ydl_opts
-        self.thread = None
-        self.ydl_opts['progress_hooks'] = [self.progress_hook]
-        self.ydl_opts['postprocessor_hooks'] = [self.postprocessor_hook]
-        self.status = StringVar(value='Queued - Waiting to extract info...')
-        self.progress = IntVar(value=0)
-
-        self.extracting = False
-        self.extracted = False
-        self.extract_info_succeed = False
-
-        # Placeholder UI
-        self.title_label = Label(self, text=f'URL: {self.url}')
-        self.title_label.pack(side=TOP)
-        self.details_frame = Frame(self)
-        self.details_frame.pack(side=TOP)
-        self.status_label = Label(self, textvariable=self.status, anchor=CENTER)
-        self.status_label.pack(side=TOP, fill=X, expand=True, padx=10)
-        self.pack(side=TOP, fill=X, pady=(0, 5), ipadx=5)
-
-        if info:
-            self.title = info.get('title', 'Unknown Title')
-            self.duration = info.get('duration_string', 'Unknown Duration')
-            self.size = info.get('filesize', info.get('filesize_approx', 0))
-            self.formats = info.get('formats', {})
-            self._update_ui_after_extraction()
-
-    def start_extraction(self):
-        self.extracting = True
-        self.status.set('Extracting info...')
-        threading.Thread(target=self._extract_info_thread, daemon=True).start()
-
-    def _extract_info_thread(self):
-        info = extract_info(self.url, self.ydl_opts)
-        if not info:
-            self.extracting = False
-            self.extracted = True
-            self.status.set('Failed to extract info')
-            self.after(0, lambda: messagebox.showerror('Error', 'URL is invalid or extraction failed!'))
+class QueueView(Frame):
+    """Download queue with a Treeview row per engine Task. Tk only draws the rows in view and apply_pending_updates only
+    reads the progress slots of those, so refreshing costs the same however long the queue is.
+    With hide_finished set, finished downloads are dropped from the view (failed ones stay so they can be seen)."""
+    PRIORITY_NAMES = {weight: name for name, weight in PRIORITY_WEIGHTS.items()}
+
+    def __init__(self, parent: Widget):
+        super().__init__(parent)
+        self.tasks: dict[str, Task] = {}  # row iid (the task_id) -> task
+        self.applied: dict[str, tuple] = {}  # row iid -> (progress_slot, transcode_slot, status_slot) last shown
+        self.hidden = 0
+
+        controls_frame = Frame(self)
+        controls_frame.pack(side=TOP, fill=X, pady=(0, 5))
+        Label(controls_frame, text='Priority of selected: ').pack(side=LEFT)
+        self.priority = StringVar(value='Normal')
+        priority_selector = Combobox(controls_frame, textvariable=self.priority, values=list(PRIORITY_WEIGHTS), state='readonly', width=8)
+        priority_selector.bind('<<ComboboxSelected>>', self.on_select_priority)  # bandwidth is rebalanced on the next poll
+        priority_selector.pack(side=LEFT)
+        self.hide_finished = BooleanVar(value=False)
+        Checkbutton(controls_frame, text='Hide finished downloads', variable=self.hide_finished, command=self.collapse_finished).pack(side=LEFT, padx=(10, 0))
+        self.count_label = Label(controls_frame, anchor=E)
+        self.count_label.pack(side=RIGHT)
+
+        tree_frame = Frame(self)
+        tree_frame.pack(side=TOP, fill=BOTH, expand=True)
+        self.tree = Treeview(tree_frame, columns=('title', 'details', 'progress', 'status', 'priority'), show='headings', height=12)
+        self.tree.heading('title', text='Title', anchor=W)
+        self.tree.heading('details', text='Details', anchor=W)
+        self.tree.heading('progress', text='Progress')
+        self.tree.heading('status', text='Status', anchor=W)
+        self.tree.heading('priority', text='Priority')
+        self.tree.column('title', width=250, anchor=W)
+        self.tree.column('details', width=250, anchor=W)
+        self.tree.column('progress', width=70, stretch=False, anchor=E)
+        self.tree.column('status', width=300, anchor=W)
+        self.tree.column('priority', width=70, stretch=False, anchor=CENTER)
+        self.tree.tag_configure('finished', foreground='gray')
+        self.tree.tag_configure('failed', foreground='red')
+        tree_scrollbar = Scrollbar(tree_frame, orient=VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=tree_scrollbar.set)
+        tree_scrollbar.pack(side=RIGHT, fill=Y)
+        self.tree.pack(side=LEFT, expand=True, fill=BOTH)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+
+        self.stats = StringVar(value='Select a download to see its stats')
+        Label(self, textvariable=self.stats, justify=LEFT).pack(side=TOP, fill=X, pady=(5, 0))
+        self.pack(side=TOP, fill=BOTH, expand=True, padx=5, pady=5)
+        self.update_count()
+
+    def add(self, task: Task):
+        iid = str(task.task_id)
+        self.tasks[iid] = task
+        self.applied[iid] = (None, None, task.status_slot)
+        self.tree.insert('', END, iid=iid, values=(task.title or f'URL: {task.url}', '', '', task.status_slot[0], self.PRIORITY_NAMES[task.priority]))
+        if task.state == EXTRACTED: self.show_details(task)
+        self.update_count()
+
+    def show_details(self, task: Task):
+        details = [f'Duration: {task.duration}', f'Size: {round(task.size / (1024 * 1024), 2)}MB' if task.size else 'unknown size']
+        if task.formats.get('video'): details.append(f'Video: {task.formats["video"]["resolution"]}@{task.formats["video"]["fps"]}fps {task.formats["video"]["codec"]} {"HDR" if task.formats["video"]["hdr"] else ""}'.rstrip())
+        if task.formats.get('audio'): details.append(f'Audio: {task.formats["audio"]["sample_rate"]} {task.formats["audio"]["bitrate"]} {task.formats["audio"]["codec"]}')
+        iid = str(task.task_id)
+        self.tree.set(iid, 'title', task.title)
+        self.tree.set(iid, 'details', ', '.join(details))
+
+    def refresh(self, task: Task):
+        """Apply the latest values written by worker threads to the task's row, must run on the UI thread"""
+        iid = str(task.task_id)
+        applied_progress_slot, applied_transcode_slot, applied_status_slot = self.applied[iid]
+        progress_slot, transcode_slot, status_slot = task.progress_slot, task.transcode_slot, task.status_slot
+        if progress_slot is not applied_progress_slot:
+            downloaded, total, speed, eta = progress_slot
+            percent = downloaded / total * 100 if total else 0
+            self.tree.set(iid, 'progress', f'{percent:.1f}%')
+            self.tree.set(iid, 'status', f'Downloading: {percent:.1f}% of {format_bytes(total)} at {format_bytes(speed)}/s ETA {format_seconds(eta)}')
+        if transcode_slot is not applied_transcode_slot:
+            self.tree.set(iid, 'progress', f'{transcode_slot[0] * 100:.1f}%')
+            self.tree.set(iid, 'status', f'Converting to {task.transcode["preferredcodec"]}: {transcode_slot[0] * 100:.1f}%')
+        if status_slot is not applied_status_slot:
+            self.tree.set(iid, 'status', status_slot[0])
+        self.applied[iid] = (progress_slot, transcode_slot, status_slot)
+
+    def visible_rows(self) -> list[str]:
+        """Rows in view, found from the top of the list instead of walking all rows"""
+        if not self.tasks:
+            return []
+        row, y = '', 0
+        while not row and y < self.tree.winfo_height():  # first row below the headings
+            row = self.tree.identify_row(y)
+            y += 4
+        rows = []
+        while row and len(rows) <= int(self.tree['height']):
+            rows.append(row)
+            row = self.tree.next(row)
+        return rows
+
+    def apply_pending_updates(self):
+        for iid in self.visible_rows():
+            self.refresh(self.tasks[iid])
+        self.update_stats()
+
+    def on_done(self, task: Task):
+        iid = str(task.task_id)
+        self.refresh(task)
+        self.tree.item(iid, tags=(task.state,))
+        if task.state == FINISHED and self.hide_finished.get():
+            self.remove(iid)
+        self.update_count()
+
+    def remove(self, iid: str):
+        self.tree.delete(iid)
+        del self.tasks[iid]
+        del self.applied[iid]
+        self.hidden += 1
+
+    def collapse_finished(self):
+        if self.hide_finished.get():
+            for iid in [iid for iid, task in self.tasks.items() if task.state == FINISHED]:
+                self.remove(iid)
+            self.update_count()
+
+    def update_count(self):
+        self.count_label.config(text=f'{len(self.tasks)} download(s)' + (f', {self.hidden} finished hidden' if self.hidden else ''))
+
+    def selected_tasks(self) -> list[Task]:
+        return [self.tasks[iid] for iid in self.tree.selection()]
+
+    def on_select(self, *args):
+        selected = self.selected_tasks()
+        if selected: self.priority.set(self.PRIORITY_NAMES[selected[0].priority])
+        self.update_stats()
+
+    def on_select_priority(self, *args):
+        for task in self.selected_tasks():
+            task.priority = PRIORITY_WEIGHTS[self.priority.get()]
+            self.tree.set(str(task.task_id), 'priority', self.priority.get())
+
+    def on_mousewheel(self, event):
+        self.tree.yview_scroll(int(-1 * (event.delta / 120)), 'units')
+        return 'break'  # keep the main window from scrolling as well
+
+    def update_stats(self):
+        selected = self.selected_tasks()
+        if not selected:
             return
+        task = selected[0]
+        t = task.telemetry()
 
-        parsed_info = parse_info(info)
-        self.title = sanitize(parsed_info['title'])
-        self.duration = parsed_info['duration']
-        self.size = parsed_info['size']
-        self.formats = parsed_info['formats']
-
-        self.after(0, self._update_ui_after_extraction)
-
-    def _update_ui_after_extraction(self):
-        self.title_label.config(text=self.title)
-        Label(self.details_frame, text=f'Duration: {self.duration}').pack(side=LEFT)
-        Label(self.details_frame, text=f'Size: {round(self.size / (1024 * 1024), 2)}MB' if self.size else 'unknown size').pack(side=LEFT)
-        format_str = ''
-        if self.formats['video']: format_str += f'Video: {self.formats["video"]["resolution"]}@{self.formats["video"]["fps"]}fps {self.formats["video"]["codec"]} {"HDR" if self.formats["video"]["hdr"] else ""}'
-        if self.formats['audio']: format_str += f'Audio: {self.formats["audio"]["sample_rate"]} {self.formats["audio"]["bitrate"]} {self.formats["audio"]["codec"]}'
-        Label(self.details_frame, text=format_str).pack(side=LEFT)
-
-        Label(self, text=f'Save to: {self.path}').pack(side=TOP)  # Show path roughly
-
-        # Re-pack status label to be at bottom
-        self.status_label.pack_forget()
-        self.progress_bar = Progressbar(self, orient=HORIZONTAL, length=100, mode='determinate', variable=self.progress, value=0)
-        self.progress_bar.pack(side=TOP, fill=X, expand=True, padx=10)
-        self.status_label.pack(side=TOP, fill=X, expand=True, padx=10)
-
-        self.extract_info_succeed = True
-        self.extracted = True
-        self.extracting = False
-        self.status.set('Ready to download')
-
-    def start_task(self):
-        global ongoing_task
-        status('Downloading')
-        self.status.set('Starting download...')
-        self.thread = threading.Thread(target=download, args=(self.url, self.ydl_opts), daemon=True)
-        self.thread.start()
-        ongoing_task = True
-
-    def progress_hook(self, d: dict):
-        global ongoing_task
-        if d['status'] == 'downloading' and '_default_template' in d:
-            percent_str = percent_str_regex.search(d['_percent_str'])
-            if percent_str:
-                percent_str = percent_str.group()
-                clean_status = ansi_escape_regex.sub('', d["_default_template"])
-                self.status.set(f'Downloading: {clean_status}')
-                self.progress.set(int(float(percent_str.rstrip('%'))))
-        elif d['status'] == 'finished':  # may have postprocessing later but can start downloading next task already since postprocessing no need internet and is usually fast
-            if self in download_queue: download_queue.remove(self)
-            self.status.set('Finished')
-            ongoing_task = False
-            status('Ready', log=False)
-        elif d['status'] == 'error':
-            if self in download_queue: download_queue.remove(self)
-            ongoing_task = False
-            self.status.set('Download error')
-            status('Ready', log=False)
-
-    def postprocessor_hook(self, d: dict):
-        global ongoing_task
-        if d['status'] == 'started' or d['status'] == 'processing':
-            self.status.set('Post-processing')
-        else:
-            if self in download_queue: download_queue.remove(self)
-            self.status.set('Finished')
-            status('Ready', log=False)
-            # do not set ongoing_ask = False here as the next download task may have already began
+        def seconds(value: Union[float, None]) -> str:
+            return f'{value:.2f}s' if value is not None else '-'
+
+        def rate(value: Union[int, None]) -> str:
+            return f'{format_bytes(value)}/s' if value is not None else '-'
+
+        self.stats.set(f'{task.title or task.url} ({t["state"]}), saving to {task.path}\n'
+                       f'Queue wait {seconds(t["queue_wait_s"])}, extraction {seconds(t["extraction_s"])}, time to first byte {seconds(t["ttfb_s"])}\n'
+                       f'Download {seconds(t["download_s"])} at {rate(t["avg_bytes_per_s"])} avg, {rate(t["peak_bytes_per_s"])} peak, '
+                       f'{t["retries"]} retries, {t["fragment_retries"]} fragment retries\n'
+                       f'Post-processing {seconds(t["postprocessing_s"])}, total {seconds(t["total_s"])}')
 
 
 root = Tk()
@@ -346,6 +321,8 @@ status_bar.rowconfigure(0, weight=1)
 status_bar.columnconfigure(1, weight=1)
 status_text = Label(status_bar, textvariable=status_var, anchor=E)
 status_text.grid(row=0, column=2, sticky=E)
+cache_stats_var = StringVar(value='')
+Label(status_bar, textvariable=cache_stats_var, anchor=W).grid(row=0, column=0, sticky=W)
 
 
 def status(text: Any, log: bool = True):
@@ -361,138 +338,105 @@ def status(text: Any, log: bool = True):
     root.title(f'YT-DLP GUI - {text}')
 
 
-def parse_info(info: dict, best_format_only: bool = True) -> dict:
-    title = info.get('title', 'Unknown Title')
-    duration = info.get('duration_string', 'Unknown Duration')
-    size = info.get('filesize', info.get('filesize_approx', 0))
-    subtitles = info.get('subtitles', {})
-    if best_format_only:  # only 1 for video and/or 1 for audio
-        formats = {'video': None, 'audio': None}
-        if 'requested_formats' in info:  # best video AND best audio
-            temp = [parse_format(f) for f in info['requested_formats']]  # best video/best audio only
-            for f in temp:
-                if f['video']: formats['video'] = f['video']
-                if f['audio']: formats['audio'] = f['audio']
-        else:  # best video OR audio only
-            format_id = info.get('format_id')
-            if format_id and 'formats' in info:
-                for f in info['formats']:
-                    if f['format_id'] == format_id:
-                        formats = parse_format(f)
-                        break
-    else:
-        formats = [parse_format(f) for f in info.get('formats', []) if f.get('format_note', '') != 'storyboard' and (f.get('vcodec', 'none') != 'none' or f.get('acodec', 'none') != 'none') and f.get('url', '')]
-    # noinspection PyUnboundLocalVariable
-    return {'title': title, 'duration': duration, 'size': size, 'subtitles': subtitles, 'formats': formats}
-
-
-def parse_format(format: dict) -> dict:
-    parsed = {'video': {}, 'audio': {}}
-    contains_video = format['vcodec'] != 'none'
-    contains_audio = format['acodec'] != 'none'
-    parsed['format_id'] = format['format_id']
-    parsed['ext'] = format['ext']
-    parsed['size'] = format.get('filesize', format.get('filesize_approx', 0))
+def format_duration(duration) -> str:
+    if not duration:
+        return ''
+    mins, secs = divmod(int(duration), 60)
+    hours, mins = divmod(mins, 60)
+    return f'{hours}:{mins:02d}:{secs:02d}' if hours else f'{mins}:{secs:02d}'
 
-    def parse_codec(codec: str) -> str:
-        mapping = {'mp4v': 'H263', 'av01': 'AV1', 'avc1': 'H264/AVC', 'hev1': 'H265/HEVC', 'vp9': 'VP9', 'vp09': 'VP9', 'vp8': 'VP8', 'mp4a': 'AAC', 'opus': 'Opus'}
-        return mapping.get(codec.split('.')[0].lower(), codec.split('.')[0].lower())
 
-    if contains_video: parsed['video'] = {'resolution': format['resolution'], 'fps': format['fps'],
-                                          'codec': parse_codec(format['vcodec']),
-                                          'hdr': format['dynamic_range'] != 'SDR'}
-    if contains_audio: parsed['audio'] = {'sample_rate': f'{round(format["asr"] / 1000, 2)}khz' if 'asr' in format else 'unknown sample rate',
-                                          'bitrate': f'{round(format["abr"])}kbps' if format.get('abr', None) and float(format['abr']) else 'unknown bitrate',
-                                          'codec': parse_codec(format['acodec'])}
-    return parsed
-
-
-def is_valid_url(url: str) -> bool:
-    try:
-        result = urllib.parse.urlparse(url)
-        return all([result.scheme, result.netloc])
-    except:
-        return False
-
-
-def get_entry_url(entry: dict, playlist_url: str) -> str:
-    """Construct a direct video URL from a flat playlist entry.
-    For YouTube, flat entries may have 'url' as just a video ID.
-    For other extractors, 'url' may already be a full URL."""
-    entry_url = entry.get('url', '')
-    if entry_url.startswith(('http://', 'https://')):
-        return entry_url
-    # YouTube-style: url is just a video ID
-    video_id = entry_url or entry.get('id', '')
-    if video_id:
-        parsed = urllib.parse.urlparse(playlist_url)
-        if 'youtube' in parsed.netloc or 'youtu.be' in parsed.netloc:
-            return f'https://www.youtube.com/watch?v={video_id}'
-        # For other sites, try constructing from the base domain
-        return f'{parsed.scheme}://{parsed.netloc}/watch?v={video_id}'
-    return playlist_url
-
-
-def show_playlist_selector(playlist_info: dict, playlist_url: str, path: str, mode: str):
-    """Show a popup for selecting which playlist videos to download."""
-    entries = playlist_info.get('entries', [])
-    if not entries:
+def show_playlist_selector(playlist_info: dict, playlist_url: str, path: str, mode: str,
+                           pages: queue.SimpleQueue = None, stop: threading.Event = None):
+    """Show a popup for selecting which playlist videos to download.
+    Entries are shown in a Treeview, which only draws the visible rows, and the selection is kept in a bytearray,
+    so it stays fast for playlists with 10k+ entries. Entries in the download archive are greyed out and not selected by default.
+    If pages is given, entries are still being enumerated by extract_flat_info and are appended as they arrive;
+    stop is set when the popup closes so enumeration does not continue in the background."""
+    entries = playlist_info.get('entries') or []
+    if not entries and pages is None:
         messagebox.showerror('Error', 'No videos found in playlist!')
         return
     entries = [e for e in entries if e is not None]
+    loading = pages is not None
 
     playlist_title = playlist_info.get('title', 'Unknown Playlist')
     popup = Toplevel(takefocus=True)
     popup.title('Select Videos')
 
+    fmt = None if mode == 'customize' else archive_format(build_ydl_opts(path, mode))  # formats are picked later, any counts
+    archived = bytearray(download_archive.contains(entry_video_key(e, playlist_url), fmt) for e in entries)
+    selected = bytearray(1 - a for a in archived)  # 1 = selected, indexed like entries
+    row_titles = [f'{i + 1}. {e.get("title", f"Video {i + 1}")}' for i, e in enumerate(entries)]
+    search_keys = [t.lower() for t in row_titles]
+    visible = list(range(len(entries)))  # entry indices shown after search filtering, ascending
+    anchor = None  # last clicked entry index, for shift-click range selection
+    filter_job = None
+
     # Header
     header_frame = Frame(popup)
     header_frame.pack(side=TOP, fill=X, padx=10, pady=(10, 5))
     Label(header_frame, text=f'{playlist_title}', font=('', 11, 'bold')).pack(side=TOP, anchor=W)
-    Label(header_frame, text=f'{len(entries)} videos').pack(side=TOP, anchor=W)
+    count_label = Label(header_frame)
+    count_label.pack(side=TOP, anchor=W)
 
-    # Select all checkbox
+    # Select all checkbox, applies to the entries matching the current search
     select_all_var = BooleanVar(value=True)
-    check_vars = []
 
     def on_select_all():
-        val = select_all_var.get()
-        for var in check_vars:
-            var.set(val)
-        update_button_text()
+        val = int(select_all_var.get())
+        for i in visible:
+            selected[i] = val
+        refresh_rows(visible)
 
     select_all_check = Checkbutton(header_frame, text='Select All / Deselect All',
                                    variable=select_all_var, command=on_select_all)
     select_all_check.pack(side=TOP, anchor=W, pady=(5, 0))
 
-    # Scrollable list of videos
-    scroll_container = Frame(popup)
-    scroll_container.pack(expand=True, fill=BOTH, side=TOP, padx=10, pady=5)
-    scrollable = ScrolledWindow(scroll_container)
-    list_frame = scrollable.scrollwindow
+    search_frame = Frame(header_frame)
+    search_frame.pack(side=TOP, fill=X, pady=(5, 0))
+    Label(search_frame, text='Search: ').pack(side=LEFT)
+    search_var = StringVar()
+    Entry(search_frame, textvariable=search_var).pack(side=LEFT, fill=X, expand=True)
 
-    # Buttons frame (created before checkboxes so update_button_text can reference them)
+    # Buttons frame (created before the list so update_button_text can reference them)
     button_frame = Frame(popup)
     button_frame.pack(side=BOTTOM, fill=X, padx=10, pady=(5, 10))
 
+    # Video list
+    tree_frame = Frame(popup)
+    tree_frame.pack(expand=True, fill=BOTH, side=TOP, padx=10, pady=5)
+    tree = Treeview(tree_frame, columns=('check', 'title', 'duration'), show='headings', selectmode='none')
+    tree.heading('check', text='')
+    tree.heading('title', text='Title (Shift+Click to select a range)', anchor=W)
+    tree.heading('duration', text='Duration')
+    tree.tag_configure('archived', foreground='gray')
+    tree.column('check', width=30, stretch=False, anchor=CENTER)
+    tree.column('title', width=500, anchor=W)
+    tree.column('duration', width=80, stretch=False, anchor=E)
+    tree_scrollbar = Scrollbar(tree_frame, orient=VERTICAL, command=tree.yview)
+    tree.configure(yscrollcommand=tree_scrollbar.set)
+    tree_scrollbar.pack(side=RIGHT, fill=Y)
+    tree.pack(side=LEFT, expand=True, fill=BOTH)
+
     def get_selected():
-        return [entries[i] for i, var in enumerate(check_vars) if var.get()]
+        return [entries[i] for i in range(len(entries)) if selected[i]]
 
     # Create buttons based on mode (need references for update_button_text)
     if mode == 'customize':
         def on_same_format():
-            selected = get_selected()
-            if not selected:
+            selected_entries = get_selected()
+            if not selected_entries:
                 return
             popup.destroy()
-            _queue_selected_entries(selected, playlist_url, path, 'customize_same')
+            _queue_selected_entries(selected_entries, playlist_url, path, 'customize_same')
 
         def on_each():
-            selected = get_selected()
-            if not selected:
+            selected_entries = get_selected()
+            if not selected_entries:
                 return
             popup.destroy()
-            _queue_selected_entries(selected, playlist_url, path, 'customize_each')
+            _queue_selected_entries(selected_entries, playlist_url, path, 'customize_each')
 
         same_btn = Button(button_frame, text=f'Same Format for All ({len(entries)})',
                           command=on_same_format)
@@ -502,11 +446,11 @@ def show_playlist_selector(playlist_info: dict, playlist_url: str, path: str, mo
         each_btn.pack(side=LEFT, expand=True, fill=X, padx=(2, 0))
     else:
         def on_download():
-            selected = get_selected()
-            if not selected:
+            selected_entries = get_selected()
+            if not selected_entries:
                 return
             popup.destroy()
-            _queue_selected_entries(selected, playlist_url, path, mode)
+            _queue_selected_entries(selected_entries, playlist_url, path, mode)
 
         dl_btn = Button(button_frame, text=f'Download Selected ({len(entries)})',
                         command=on_download)
@@ -515,7 +459,7 @@ def show_playlist_selector(playlist_info: dict, playlist_url: str, path: str, mo
     Button(button_frame, text='Cancel', command=popup.destroy).pack(side=RIGHT, padx=(5, 0))
 
     def update_button_text():
-        count = sum(1 for var in check_vars if var.get())
+        count = selected.count(1)
         if mode == 'customize':
             same_btn.config(text=f'Same Format for All ({count})')
             each_btn.config(text=f'Customize Each ({count})')
@@ -525,59 +469,107 @@ def show_playlist_selector(playlist_info: dict, playlist_url: str, path: str, mo
             dl_btn.config(text=f'Download Selected ({count})')
             dl_btn.config(state=NORMAL if count > 0 else DISABLED)
 
-    for i, entry in enumerate(entries):
-        var = BooleanVar(value=True)
-        check_vars.append(var)
-        title = entry.get('title', f'Video {i + 1}')
-        duration = entry.get('duration')
-        if duration:
-            mins, secs = divmod(int(duration), 60)
-            hours, mins = divmod(mins, 60)
-            dur_str = f' [{hours}:{mins:02d}:{secs:02d}]' if hours else f' [{mins}:{secs:02d}]'
+    def refresh_rows(indices):
+        for i in indices:
+            tree.set(str(i), 'check', '☑' if selected[i] else '☐')
+        update_button_text()
+
+    def insert_rows(indices):
+        for i in indices:
+            tree.insert('', END, iid=str(i), values=('☑' if selected[i] else '☐', row_titles[i], format_duration(entries[i].get('duration'))),
+                        tags=('archived',) if archived[i] else ())
+        count_text = f'{len(entries)} videos' if len(visible) == len(entries) else f'{len(visible)} of {len(entries)} videos'
+        if archived.count(1): count_text += f', {archived.count(1)} already downloaded'
+        count_label.config(text=f'{count_text} (loading more...)' if loading else count_text)
+
+    def populate():
+        tree.delete(*tree.get_children())
+        insert_rows(visible)
+
+    def apply_filter():
+        nonlocal filter_job
+        filter_job = None
+        if not popup.winfo_exists():
+            return
+        query = search_var.get().strip().lower()
+        visible[:] = [i for i, key in enumerate(search_keys) if query in key] if query else range(len(entries))
+        populate()
+
+    def on_search(*args):
+        nonlocal filter_job
+        if filter_job: root.after_cancel(filter_job)
+        filter_job = root.after(150, apply_filter)  # debounce typing
+
+    search_var.trace_add('write', on_search)
+
+    def on_click(e):
+        nonlocal anchor
+        if tree.identify_region(e.x, e.y) not in ('cell', 'tree'):
+            return
+        row = tree.identify_row(e.y)
+        if not row:
+            return 'break'
+        i = int(row)
+        if e.state & 0x0001 and anchor is not None and anchor in visible:  # Shift held: set range to the anchor's state
+            lo, hi = sorted((bisect.bisect_left(visible, anchor), bisect.bisect_left(visible, i)))
+            val = selected[anchor]
+            for j in visible[lo:hi + 1]:
+                selected[j] = val
+            refresh_rows(visible[lo:hi + 1])
         else:
-            dur_str = ''
-        cb = Checkbutton(list_frame, text=f'{i + 1}. {title}{dur_str}', variable=var,
-                         command=update_button_text)
-        cb.pack(side=TOP, anchor=W, padx=5, pady=1)
+            selected[i] ^= 1
+            anchor = i
+            refresh_rows((i,))
+        return 'break'
 
-    # Bind mousewheel scrolling at the canvas level so it works over all children
-    scrollable.canv.bind_all("<MouseWheel>", lambda e: scrollable.canv.yview_scroll(int(-1 * (e.delta / 120)), "units"))
+    tree.bind('<Button-1>', on_click)
 
-    def _unbind_on_destroy(e):
+    def receive_pages():
+        nonlocal loading
+        if not popup.winfo_exists():
+            return
+        new_indices = []
         try:
-            scrollable.canv.unbind_all("<MouseWheel>")
-        except TclError:
+            while True:
+                page = pages.get_nowait()
+                if page is None:
+                    loading = False
+                    break
+                query = search_var.get().strip().lower()
+                for entry in page:
+                    i = len(entries)
+                    entries.append(entry)
+                    archived.append(download_archive.contains(entry_video_key(entry, playlist_url), fmt))
+                    selected.append(int(select_all_var.get() and not archived[i]))
+                    row_titles.append(f'{i + 1}. {entry.get("title", f"Video {i + 1}")}')
+                    search_keys.append(row_titles[i].lower())
+                    if query in search_keys[i]:
+                        visible.append(i)
+                        new_indices.append(i)
+        except queue.Empty:
             pass
+        insert_rows(new_indices)
+        update_button_text()
+        if loading:
+            root.after(100, receive_pages)
+        elif not entries:
+            popup.destroy()
+            messagebox.showerror('Error', 'No videos found in playlist!')
 
-    popup.bind("<Destroy>", _unbind_on_destroy)
-
-    # Auto-size width to fit content, capped at 50% screen width for initial size.
-    # User can still manually resize wider than the cap.
-    popup.update_idletasks()
-    max_width = popup.winfo_screenwidth() // 2
-    needed_width = popup.winfo_reqwidth() + 40  # padding for scrollbar + borders
-    initial_width = min(needed_width, max_width)
-    popup.geometry(f'{initial_width}x500')
+    if stop is not None:
+        popup.bind('<Destroy>', lambda e: stop.set() if e.widget is popup else None)
+    populate()
+    update_button_text()
+    if loading: receive_pages()
+    popup.geometry(f'{min(800, popup.winfo_screenwidth() // 2)}x500')
 
 
 def _queue_selected_entries(entries: list, playlist_url: str, path: str, mode: str):
     """Queue download tasks for selected playlist entries."""
-    if mode == 'video_best':
+    if mode in ('video_best', 'audio_best'):
         for entry in entries:
             video_url = get_entry_url(entry, playlist_url)
-            ydl_opts = copy.deepcopy(ydl_base_opts)
-            ydl_opts['noplaylist'] = True
-            ydl_opts['outtmpl'] = os.path.join(path, ydl_opts['outtmpl'] if isinstance(ydl_opts['outtmpl'], str) else ydl_opts['outtmpl']['default'])
-            download_queue.append(DownloadTask(video_url, path, ydl_opts, queue_frame))
-    elif mode == 'audio_best':
-        for entry in entries:
-            video_url = get_entry_url(entry, playlist_url)
-            ydl_opts = copy.deepcopy(ydl_base_opts)
-            ydl_opts['noplaylist'] = True
-            ydl_opts.update({'format': 'bestaudio'})
-            ydl_opts['outtmpl'] = os.path.join(path, ydl_opts['outtmpl'] if isinstance(ydl_opts['outtmpl'], str) else ydl_opts['outtmpl']['default'])
-            ydl_opts['outtmpl'] = ydl_opts['outtmpl'].replace('.%(ext)s', '_audio.%(ext)s')
-            download_queue.append(DownloadTask(video_url, path, ydl_opts, queue_frame))
+            download_engine.add(Task(video_url, path, build_ydl_opts(path, mode), check_archive=False))
     elif mode == 'customize_same':
         # Show format picker for first video, then apply to all
         urls = [get_entry_url(e, playlist_url) for e in entries]
@@ -589,12 +581,118 @@ def _queue_selected_entries(entries: list, playlist_url: str, path: str, mode: s
         _chain_customize(urls, path, 0)
 
 
-def _chain_customize(urls: list, path: str, index: int):
-    """Show format picker for each URL sequentially."""
+def _chain_customize(urls: list, path: str, index: int, prefetched: dict = None):
+    """Show format picker for each URL sequentially, while the next PREFETCH_AHEAD URLs are extracted in the background
+    so their pickers open without waiting."""
     if index >= len(urls):
         return
-    handle_download_info(urls[index], path,
-                         on_complete=lambda: _chain_customize(urls, path, index + 1))
+    if prefetched is None: prefetched = {}
+    for ahead in range(index + 1, min(index + 1 + PREFETCH_AHEAD, len(urls))):
+        if ahead not in prefetched: prefetched[ahead] = prefetch_details(urls[ahead])
+    handle_download_info(urls[index], path, prefetched=prefetched.pop(index, None),
+                         on_complete=lambda: _chain_customize(urls, path, index + 1, prefetched))
+
+
+def prefetch_details(url: str) -> concurrent.futures.Future:
+    """Extract and parse url on the extraction pool for a later handle_download_info, the future's result is
+    (info, FormatTable) or (None, None) when extraction failed, in which case the details window extracts again to report it"""
+    ydl_opts = copy.deepcopy(ydl_base_opts)
+    ydl_opts['noplaylist'] = True
+
+    def _prefetch():
+        info = extract_info(url, ydl_opts, ignore_error=True)
+        return (info, FormatTable(info)) if info else (None, None)
+
+    return extraction_executor.submit(_prefetch)
+
+
+def show_bulk_import(path: str):
+    """Window to queue many URLs at once, pasted, loaded from text files or dropped on it.
+    URLs already in the queue or downloaded before are skipped."""
+    popup = Toplevel()
+    popup.title('Import URLs')
+    popup.geometry('600x400')
+    Label(popup, text='One or more URLs per line, lines starting with # are ignored:').pack(side=TOP, anchor=W, padx=10, pady=(10, 0))
+    button_frame = Frame(popup)
+    button_frame.pack(side=BOTTOM, fill=X, padx=10, pady=(5, 10))
+    text_frame = Frame(popup)
+    text_frame.pack(expand=True, fill=BOTH, side=TOP, padx=10, pady=5)
+    text = Text(text_frame, wrap=NONE, undo=True)
+    text_scrollbar = Scrollbar(text_frame, orient=VERTICAL, command=text.yview)
+    text.configure(yscrollcommand=text_scrollbar.set)
+    text_scrollbar.pack(side=RIGHT, fill=Y)
+    text.pack(side=LEFT, expand=True, fill=BOTH)
+    try:
+        clipboard = root.clipboard_get()
+        if any(is_valid_url(url) for url in parse_url_list(clipboard)): text.insert(END, clipboard)
+    except TclError:  # clipboard is empty or not text
+        pass
+
+    def load_files(file_paths: list):
+        for file_path in file_paths:
+            try:
+                with open(file_path, encoding='utf-8', errors='replace') as f:
+                    text.insert(END, f.read().rstrip('\n') + '\n')
+            except OSError as e:
+                messagebox.showerror('Error', f'Could not read {file_path}: {e}', parent=popup)
+
+    def on_load_file():
+        load_files(filedialog.askopenfilenames(parent=popup, title='Choose files with URLs', filetypes=[('Text files', '*.txt'), ('All files', '*.*')]))
+
+    if TkinterDnD is not None:
+        def on_drop(event):
+            items = root.tk.splitlist(event.data)
+            if items and all(os.path.isfile(item) for item in items):
+                load_files(items)
+            else:
+                text.insert(END, event.data.rstrip('\n') + '\n')
+            return event.action
+
+        try:
+            TkinterDnD._require(root)
+            text.drop_target_register(DND_FILES, DND_TEXT)
+            text.dnd_bind('<<Drop>>', on_drop)
+        except (RuntimeError, TclError) as e:
+            logger.warning(f'Drag and drop is not available: {e}')
+
+    mode_buttons = []
+
+    def on_import(mode: str):
+        if not path.strip():
+            messagebox.showerror('Error', 'Download directory is empty! Please choose a folder.', parent=popup)
+            return
+        urls = parse_url_list(text.get('1.0', END))
+        if not urls:
+            messagebox.showerror('Error', 'No URLs to import!', parent=popup)
+            return
+        for button in mode_buttons:
+            button.configure(state=DISABLED)
+        popup.title(f'Checking {len(urls)} URL(s)...')
+        queued_urls = [task.url for task in (*download_engine.tasks.values(), *download_engine.transcoding)]
+        fmt = archive_format(build_ydl_opts(path, mode)) if mode in ('video_best', 'audio_best') else None
+
+        def _filter_thread():
+            result = filter_new_urls(urls, queued_urls, fmt)
+            root.after(0, _queue_urls, *result)
+
+        def _queue_urls(new_urls: list, invalid: int, duplicates: int):
+            if not popup.winfo_exists():  # cancelled while checking
+                return
+            popup.destroy()
+            if new_urls:
+                with queue_store.batch():
+                    _queue_selected_entries([{'url': url} for url in new_urls], '', path, mode)
+            status(f'Imported {len(new_urls)} URL(s), skipped {duplicates} duplicate(s) and {invalid} invalid')
+
+        threading.Thread(target=_filter_thread, daemon=True).start()
+
+    Button(button_frame, text='Load File...', command=on_load_file).pack(side=LEFT, padx=(0, 5))
+    for label, mode in (('Download Video', 'video_best'), ('Download Audio', 'audio_best'),
+                        ('Same Format for All', 'customize_same'), ('Customize Each', 'customize_each')):
+        mode_buttons.append(Button(button_frame, text=label, command=lambda mode=mode: on_import(mode)))
+        mode_buttons[-1].pack(side=LEFT, expand=True, fill=X, padx=2)
+    Button(button_frame, text='Cancel', command=popup.destroy).pack(side=RIGHT, padx=(5, 0))
+    text.focus_set()
 
 
 def detect_and_handle(url: str, path: str, mode: str):
@@ -632,14 +730,25 @@ def detect_and_handle(url: str, path: str, mode: str):
     checking_popup.protocol("WM_DELETE_WINDOW", on_popup_close)
 
     def _detect_thread():
-        info = extract_flat_info(url)
+        streaming = False
 
-        def _handle_result():
+        def on_playlist(playlist_info: dict, pages: queue.SimpleQueue, stop: threading.Event):
+            nonlocal streaming
+            streaming = True
+            root.after(0, _handle_result, playlist_info, pages, stop)
+
+        def _handle_result(info: dict, pages: queue.SimpleQueue = None, stop: threading.Event = None):
             if not checking_popup.winfo_exists():
+                if stop: stop.set()
                 _re_enable()
                 return
             checking_popup.destroy()
 
+            if pages is not None:  # playlist still being enumerated, selector fills in as pages arrive
+                _re_enable()
+                show_playlist_selector(info, url, path, mode, pages, stop)
+                return
+
             if not info:
                 _re_enable()
                 messagebox.showerror('Error', 'URL is invalid or extraction failed!')
@@ -650,43 +759,39 @@ def detect_and_handle(url: str, path: str, mode: str):
                 _re_enable()
                 show_playlist_selector(info, url, path, mode)
             else:
-                # Single video - delegate to original handler
+                # Single video - delegate to original handler, reusing the full info dict flat extraction returned for it
                 _re_enable()
-                _handle_single(url, path, mode)
+                _handle_single(url, path, mode, info if 'formats' in info else None)
 
-        root.after(0, _handle_result)
+        result = extract_flat_info(url, on_playlist)
+        if not streaming: root.after(0, _handle_result, result)
 
     threading.Thread(target=_detect_thread, daemon=True).start()
 
 
-def _handle_single(url: str, path: str, mode: str):
+def _handle_single(url: str, path: str, mode: str, info: dict = None):
     """Delegate to the original per-mode handler for a single video."""
     if mode == 'video_best':
-        handle_download_video_best(url, path)
+        handle_download_video_best(url, path, info)
     elif mode == 'audio_best':
-        handle_download_audio_best(url, path)
+        handle_download_audio_best(url, path, info)
     elif mode == 'customize':
-        handle_download_info(url, path)
+        handle_download_info(url, path, extracted_info=info)
 
 
-def handle_download_video_best(url: str, path: str):
-    ydl_opts = copy.deepcopy(ydl_base_opts)
-    ydl_opts['noplaylist'] = True
-    ydl_opts['outtmpl'] = os.path.join(path, ydl_opts['outtmpl'] if isinstance(ydl_opts['outtmpl'], str) else ydl_opts['outtmpl']['default'])
-    download_queue.append(DownloadTask(url, path, ydl_opts, queue_frame))
+def handle_download_video_best(url: str, path: str, info: dict = None):
+    download_engine.add(Task(url, path, build_ydl_opts(path, 'video_best'), extracted_info=info))
 
 
-def handle_download_audio_best(url: str, path: str):
-    ydl_opts = copy.deepcopy(ydl_base_opts)
-    ydl_opts['noplaylist'] = True
-    ydl_opts.update({'format': 'bestaudio'})
-    ydl_opts['outtmpl'] = os.path.join(path, ydl_opts['outtmpl'] if isinstance(ydl_opts['outtmpl'], str) else ydl_opts['outtmpl']['default'])
-    ydl_opts['outtmpl'] = ydl_opts['outtmpl'].replace('.%(ext)s', '_audio.%(ext)s')
-    download_queue.append(DownloadTask(url, path, ydl_opts, queue_frame))
+def handle_download_audio_best(url: str, path: str, info: dict = None):
+    download_engine.add(Task(url, path, build_ydl_opts(path, 'audio_best'), extracted_info=info))
 
 
 def handle_download_info(url: str, path: str, ydl_opts: dict = None,
-                         on_complete: Callable = None, apply_to_urls: list = None):
+                         on_complete: Callable = None, apply_to_urls: list = None, extracted_info: dict = None,
+                         prefetched: concurrent.futures.Future = None):
+    """Show the format picker for url. prefetched is a future from prefetch_details(), used instead of extracting
+    again, and the picker opens right away when it is already done."""
     if not url:
         messagebox.showerror('Error', 'URL is empty!')
         if on_complete: on_complete()
@@ -697,25 +802,41 @@ def handle_download_info(url: str, path: str, ydl_opts: dict = None,
         return
     if not ydl_opts: ydl_opts = copy.deepcopy(ydl_base_opts)
     ydl_opts['noplaylist'] = True
+    # Extract the first few other videos while the user picks a format, as many as the engine would start and prefetch.
+    # Their tasks find the result in the metadata cache (or share the running extraction), so the options that are part
+    # of its key must match the tasks': the profile decides extractor_args. The rest are extracted by the engine as usual.
+    warm_up_opts = copy.deepcopy(ydl_opts)
+    apply_performance_profile(warm_up_opts, performance_profile_var.get())
+    window = download_engine.max_downloads + download_engine.prefetch_ahead
+    warm_up = [extraction_executor.submit(extract_info, extra_url, warm_up_opts, True) for extra_url in (apply_to_urls or [])[:window]]
+
+    def cancel_warm_up():
+        """Drop the warm-ups that haven't started, the queued tasks extract those themselves"""
+        for future in warm_up:
+            future.cancel()
 
     # Disable button to prevent spamming
     download_info_button.config(state=DISABLED)
 
-    # Create loading popup
-    loading_popup = Toplevel(takefocus=True)
-    loading_popup.title('Loading...')
-    Label(loading_popup, text='Extracting info, please wait...').pack(padx=20, pady=20)
-    loading_popup.update()
+    ready = prefetched is not None and prefetched.done() and not prefetched.cancelled() and prefetched.result()[0]
+    if not ready:  # create loading popup
+        loading_popup = Toplevel(takefocus=True)
+        loading_popup.title('Loading...')
+        Label(loading_popup, text='Extracting info, please wait...').pack(padx=20, pady=20)
+        loading_popup.update()
 
     def on_loading_close():
         loading_popup.destroy()
+        cancel_warm_up()
         download_info_button.config(state=NORMAL)
         if on_complete: on_complete()
 
-    loading_popup.protocol("WM_DELETE_WINDOW", on_loading_close)
+    if not ready: loading_popup.protocol("WM_DELETE_WINDOW", on_loading_close)
 
     def _extract_thread():
-        info = extract_info(url, ydl_opts)
+        info, table = prefetched.result() if prefetched is not None and not prefetched.cancelled() else (None, None)
+        if not info:
+            info, table = extract_info(url, ydl_opts, info=extracted_info), None
 
         def _handle_result():
             # Check if loading popup still exists (might be closed by user)
@@ -727,56 +848,128 @@ def handle_download_info(url: str, path: str, ydl_opts: dict = None,
             if not info:
                 status('Ready')
                 messagebox.showerror('Error', 'URL is invalid or extraction failed!')
+                cancel_warm_up()
                 download_info_button.config(state=NORMAL)
                 if on_complete: on_complete()
                 return
 
-            _show_details(info)
+            _show_details(info, table)
 
         root.after(0, _handle_result)
 
-    def _show_details(info):
-        parsed_info = parse_info(info, best_format_only=False)
+    def _show_details(info, table=None):
+        if table is None: table = FormatTable(info)
+        parsed_info = parse_info(info)
         details_window = Toplevel(takefocus=True)  # no need mainloop here as below we use the general global mainloop function
         details_window.title('Extracted Info')
 
         def on_details_close():
             details_window.destroy()
+            cancel_warm_up()
             download_info_button.config(state=NORMAL)
             if on_complete: on_complete()
 
         details_window.protocol("WM_DELETE_WINDOW", on_details_close)
 
-        Label(details_window, text=f'{parsed_info["title"]} ({parsed_info["duration"]})', anchor=CENTER).pack(side=TOP, fill=X, expand=True, padx=10)
+        Label(details_window, text=f'{parsed_info["title"]} ({parsed_info["duration"]})', anchor=CENTER).pack(side=TOP, fill=X, padx=10)
 
-        scroll_container_frame = Frame(details_window)
-        scroll_container_frame.pack(expand=True, fill=BOTH, side=TOP)
-        scrollableFrame = ScrolledWindow(scroll_container_frame)
-        formats_frame = LabelFrame(scrollableFrame.scrollwindow, text='Download Options')
+        formats_frame = LabelFrame(details_window, text='Download Options')
         formats_frame.pack(side=TOP, fill=BOTH, expand=True, padx=(10, 10), pady=(10, 0))
-        formats = parsed_info['formats']
-
-        # noinspection PyArgumentList
-        def on_select_single_format(*args):
-            if video_only_formats[video_selected_format.get()] is None and audio_only_formats[audio_selected_format.get()] is None:  # if both selected nothing, unlock radio buttons
-                for radio_button in radiobutton_frame.winfo_children():
-                    radio_button.configure(state=NORMAL)
-                selected_format.set('')
-            else:
-                for radio_button in radiobutton_frame.winfo_children():
-                    radio_button.configure(state=DISABLED)
-                selected = []
-                if video_only_formats[video_selected_format.get()]: selected.append(video_only_formats[video_selected_format.get()])
-                if audio_only_formats[audio_selected_format.get()]: selected.append(audio_only_formats[audio_selected_format.get()])
-                selected_format.set('+'.join(selected))  # allow 1 only
+        rows = list(range(len(table)))  # rows shown after filtering, in the current sort order
+        search_keys = [' '.join(table.row_values(row)).lower() for row in rows]
+        sort_column, sort_reverse = None, False
+
+        # Filters, the quick filter picks the best download within its limits and selects it
+        filter_frame = Frame(formats_frame)
+        filter_frame.pack(side=TOP, fill=X, pady=(5, 0))
+        Label(filter_frame, text='Show: ').pack(side=LEFT)
+        kind_filter = StringVar(value='All')
+        kind_selector = Combobox(filter_frame, textvariable=kind_filter, values=['All', FormatTable.MUXED, FormatTable.VIDEO, FormatTable.AUDIO], state='readonly', width=12)
+        kind_selector.pack(side=LEFT)
+        Label(filter_frame, text='Search: ').pack(side=LEFT, padx=(10, 0))
+        search_var = StringVar()
+        Entry(filter_frame, textvariable=search_var).pack(side=LEFT, fill=X, expand=True)
+        quick_frame = Frame(formats_frame)
+        quick_frame.pack(side=TOP, fill=X, pady=(5, 0))
+        Label(quick_frame, text='Best up to ').pack(side=LEFT)
+        max_height_var = StringVar(value='Any')
+        Combobox(quick_frame, textvariable=max_height_var, values=['Any'] + [f'{h}p' for h in (4320, 2160, 1440, 1080, 720, 480, 360, 240, 144)], width=6).pack(side=LEFT)
+        Label(quick_frame, text=' in ').pack(side=LEFT)
+        vcodec_var = StringVar(value='Any codec')
+        Combobox(quick_frame, textvariable=vcodec_var, values=['Any codec'] + sorted({c for c in table.vcodec if c}), state='readonly', width=12).pack(side=LEFT)
+        Label(quick_frame, text=' under ').pack(side=LEFT)
+        max_size_var = StringVar()
+        Entry(quick_frame, textvariable=max_size_var, width=6).pack(side=LEFT)
+        Label(quick_frame, text=' MB ').pack(side=LEFT)
+        hint = StringVar()
+
+        tree_frame = Frame(formats_frame)
+        tree_frame.pack(side=TOP, fill=BOTH, expand=True, pady=(5, 0))
+        tree = Treeview(tree_frame, columns=FormatTable.COLUMNS, show='headings', height=15)
+        for column, text, width in (('kind', 'Type', 90), ('resolution', 'Resolution', 100), ('fps', 'FPS', 50), ('vcodec', 'Video codec', 90), ('acodec', 'Audio codec', 90),
+                                    ('bitrate', 'Bitrate', 80), ('size', 'Size', 90), ('ext', 'Ext', 50), ('format_id', 'ID', 70)):
+            tree.heading(column, text=text, command=lambda c=column: sort_by(c))
+            tree.column(column, width=width, anchor=W if column == 'kind' else CENTER)
+        tree_scrollbar = Scrollbar(tree_frame, orient=VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=tree_scrollbar.set)
+        tree_scrollbar.pack(side=RIGHT, fill=Y)
+        tree.pack(side=LEFT, expand=True, fill=BOTH)
+        Label(formats_frame, textvariable=hint, anchor=W).pack(side=TOP, fill=X)
+
+        def populate():
+            selection = tree.selection()
+            tree.delete(*tree.get_children())
+            kind, query = kind_filter.get(), search_var.get().strip().lower()
+            for row in rows:
+                if (kind == 'All' or table.kind[row] == kind) and query in search_keys[row]:
+                    tree.insert('', END, iid=str(row), values=table.row_values(row))
+            tree.selection_set([iid for iid in selection if tree.exists(iid)])
+            on_select_rows()
+
+        def sort_by(column):
+            nonlocal sort_column, sort_reverse
+            sort_reverse = not sort_reverse if column == sort_column else column not in ('kind', 'vcodec', 'acodec', 'ext', 'format_id')  # numbers highest first
+            sort_column = column
+            keys = table.sort_keys(column)
+            rows.sort(key=keys.__getitem__, reverse=sort_reverse)
+            populate()
+
+        def select_best():
             try:
-                if video_only_formats[video_selected_format.get()] is None and audio_only_formats[audio_selected_format.get()] is not None:
-                    audio_convert_selector.configure(state=NORMAL)
-                else:
-                    audio_convert_selector.configure(state=DISABLED)
-                    audio_convert_quality_selector.configure(state=DISABLED)
-            except NameError:  # if audio convert selector is not defined yet
-                pass
+                max_size = round(float(max_size_var.get()) * 1024 * 1024) if max_size_var.get().strip() else None
+                max_height = int(max_height_var.get().rstrip('p')) if max_height_var.get() != 'Any' else None
+            except ValueError:
+                hint.set('Enter the height like 1080p and the size in MB')
+                return
+            best = table.best(max_height, vcodec_var.get() if vcodec_var.get() != 'Any codec' else None, max_size)
+            if not best:
+                hint.set('No format within these limits')
+                return
+            kind_filter.set('All')
+            search_var.set('')  # make sure the picked rows are shown
+            populate()
+            tree.selection_set([str(row) for row in best])
+            tree.see(str(best[0]))
+
+        Button(quick_frame, text='Select Best', command=select_best).pack(side=LEFT, padx=(5, 0))
+
+        def selected_rows() -> list[int]:
+            return [int(iid) for iid in tree.selection()]
+
+        def on_select_rows(*args):
+            """One format with both video and audio, or one video only and/or one audio only format to be merged"""
+            selected = selected_rows()
+            kinds = [table.kind[row] for row in selected]
+            valid = bool(selected) and (kinds == [FormatTable.MUXED] or (FormatTable.MUXED not in kinds and kinds.count(FormatTable.VIDEO) <= 1 and kinds.count(FormatTable.AUDIO) <= 1))
+            selected.sort(key=lambda row: table.kind[row] != FormatTable.VIDEO)  # video first, like yt-dlp's VIDEO+AUDIO
+            selected_format.set('+'.join(table.format_id[row] for row in selected) if valid else '')
+            if selected and not valid:
+                hint.set('Select one format with video and audio, or one video only and/or one audio only format (Ctrl+Click)')
+            else:
+                hint.set(f'Total size: {format_bytes(sum(table.size[row] for row in selected))}' if selected else 'Sort by clicking a column heading, Ctrl+Click to combine video and audio')
+            audio_only = valid and kinds == [FormatTable.AUDIO]
+            audio_convert_selector.configure(state=NORMAL if audio_only else DISABLED)
+            audio_convert_quality_selector.configure(state=NORMAL if audio_only and audio_convert_format.get() != 'Do not convert' else DISABLED)
 
         def on_select_format(*args):
             download_button.configure(state=NORMAL if selected_format.get() else DISABLED)
@@ -786,41 +979,39 @@ def handle_download_info(url: str, path: str, ydl_opts: dict = None,
 
         def handle_download():
             nonlocal ydl_opts
+            selected = selected_rows()
             ydl_opts['format'] = selected_format.get()
-            if video_only_formats[video_selected_format.get()] is None and audio_only_formats[audio_selected_format.get()] is not None and valid_audio_convert_formats[audio_convert_format.get()] is not None:
+            apply_performance_profile(ydl_opts, performance_profile.get())
+            if [table.kind[row] for row in selected] == [FormatTable.AUDIO] and valid_audio_convert_formats[audio_convert_format.get()] is not None:
                 ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': valid_audio_convert_formats[audio_convert_format.get()], 'preferredquality': audio_convert_quality_values[audio_convert_quality.get()]}]  # 0 highest, 10 lowest.
-            ydl_opts['outtmpl'] = os.path.join(path, ydl_opts['outtmpl'] if isinstance(ydl_opts['outtmpl'], str) else ydl_opts['outtmpl']['default'])
+            base_tmpl = ydl_opts['outtmpl'] if isinstance(ydl_opts['outtmpl'], str) else ydl_opts['outtmpl']['default']
+            extra_opts = copy.deepcopy(ydl_opts)  # before Task takes the audio conversion out of ydl_opts
+            ydl_opts['outtmpl'] = os.path.join(path, base_tmpl)
 
-            # Construct task_info for DownloadTask
+            # Construct the summary shown in the queue before the task is extracted
             task_info = {
                 'title': parsed_info['title'],
                 'duration_string': parsed_info['duration'],
                 'filesize': parsed_info['size'],
                 'formats': {'video': None, 'audio': None}
             }
+            for row in selected:
+                f = table.parse(row)
+                if f['video']: task_info['formats']['video'] = f['video']
+                if f['audio']: task_info['formats']['audio'] = f['audio']
 
-            # Find selected formats
-            sel_fmt = selected_format.get()
-            if sel_fmt:
-                sel_ids = sel_fmt.split('+')
-                for f in parsed_info['formats']:
-                    if f['format_id'] in sel_ids:
-                        if f['video']: task_info['formats']['video'] = f['video']
-                        if f['audio']: task_info['formats']['audio'] = f['audio']
-
-            download_queue.append(DownloadTask(url, path, ydl_opts, queue_frame, task_info))
+            download_engine.add(Task(url, path, ydl_opts, task_info, extracted_info=info, check_archive=False))
 
-            # If apply_to_urls is set, queue the same format for all other URLs
+            # If apply_to_urls is set, queue the same choice for all other URLs. Format IDs are specific to this video,
+            # so it is turned into a selector that each video resolves during its own extraction
             if apply_to_urls:
-                for extra_url in apply_to_urls:
-                    extra_opts = ydl_opts.copy()
-                    extra_opts['noplaylist'] = True
-                    # Reset outtmpl for each new video
-                    base_tmpl = ydl_base_opts['outtmpl'] if isinstance(ydl_base_opts['outtmpl'], str) else ydl_base_opts['outtmpl']['default']
-                    extra_opts['outtmpl'] = os.path.join(path, base_tmpl)
-                    extra_opts['progress_hooks'] = []
-                    extra_opts['postprocessor_hooks'] = []
-                    download_queue.append(DownloadTask(extra_url, path, extra_opts, queue_frame))
+                cancel_warm_up()
+                extra_opts['format'] = format_selector(info, selected_format.get())
+                extra_opts['outtmpl'] = os.path.join(path, base_tmpl)
+                with queue_store.batch():
+                    for extra_url in apply_to_urls:
+                        download_engine.add(Task(extra_url, path, copy.deepcopy(extra_opts), check_archive=False))
+                download_engine.dispatch()
 
             ydl_opts = copy.deepcopy(ydl_base_opts)  # reset for next task
             details_window.destroy()
@@ -828,37 +1019,17 @@ def handle_download_info(url: str, path: str, ydl_opts: dict = None,
             download_info_button.config(state=NORMAL)
             if on_complete: on_complete()
 
-        download_button = Button(scrollableFrame.scrollwindow, text='Download', command=handle_download)  # have to define first else callbacks below complain
+        options_frame = Frame(details_window)
+        options_frame.pack(side=TOP, fill=X, padx=10)
+        download_button = Button(details_window, text='Download', command=handle_download)  # have to define first else callbacks below complain
         selected_format = StringVar()
         selected_format.trace_add('write', on_select_format)
-        video_only_formats, audio_only_formats = {'Select video format': None}, {'Select audio format': None}  # {text: value} except for None
-        radiobutton_frame = Frame(formats_frame, relief='groove', borderwidth=3)
-        radiobutton_frame.pack(side=TOP, fill=X, expand=True)
-        for f in formats:
-            if f['video'] and f['audio']:  # video AND audio
-                Radiobutton(radiobutton_frame, variable=selected_format, value=f['format_id'],
-                            text=f'Video: {f["video"]["resolution"]}@{f["video"]["fps"]}fps {f["video"]["codec"]} {"HDR" if f["video"]["hdr"] else ""}\n'
-                                 f'Audio: {f["audio"]["sample_rate"]} {f["audio"]["bitrate"]} {f["audio"]["codec"]}\n'
-                                 f'File extension: {f["ext"]} Size: ' + (f'{round(f["size"] / (1024 * 1024), 2)}MB' if f["size"] else 'unknown size')).pack(side=TOP, fill=X, expand=True, pady=(0, 10))
-            else:  # video only or audio only
-                if f['video']: video_only_formats[f'{f["video"]["resolution"]}@{f["video"]["fps"]}fps {f["video"]["codec"]} {"HDR" if f["video"]["hdr"] else ""}'] = f['format_id']
-                if f['audio']: audio_only_formats[f'{f["audio"]["sample_rate"]} {f["audio"]["bitrate"]} {f["audio"]["codec"]}'] = f['format_id']
-        if not len(radiobutton_frame.winfo_children()): Label(radiobutton_frame, text='No stream containing both video and audio available', anchor=CENTER).pack(side=TOP, fill=X, expand=True)
-
-        custom_formats_frame = LabelFrame(formats_frame, text='Customize', borderwidth=3)
-        custom_formats_frame.pack(side=TOP, fill=X, expand=True)
-        video_selected_format = StringVar(value='Select video format')
-        video_selected_format.trace_add('write', on_select_single_format)
-        audio_selected_format = StringVar(value='Select audio format')
-        audio_selected_format.trace_add('write', on_select_single_format)
-        OptionMenu(custom_formats_frame, video_selected_format, 'Select video format', *video_only_formats.keys()).pack(side=TOP, fill=X, expand=True, pady=(0, 10))
-        OptionMenu(custom_formats_frame, audio_selected_format, 'Select audio format', *audio_only_formats.keys()).pack(side=TOP, fill=X, expand=True, pady=(0, 10))
         audio_convert_format = StringVar(value='Do not convert')
         valid_audio_convert_formats = {'Do not convert': None, 'AAC (.m4a)': 'aac', 'ALAC (.m4a)': 'alac', 'FLAC (.flac)': 'flac', 'm4a (.m4a)': 'm4a', 'mp3 (.mp3)': 'mp3', 'Opus (.opus)': 'opus', 'Vorbis (.ogg)': 'vorbis', 'WAV (.wav)': 'wav'}
-        audio_convert_frame = LabelFrame(formats_frame, text='Convert audio format to', borderwidth=3)
-        audio_convert_frame.pack(side=TOP, fill=X, expand=True)
+        audio_convert_frame = LabelFrame(options_frame, text='Convert audio format to', borderwidth=3)
+        audio_convert_frame.pack(side=LEFT, fill=X, expand=True)
         audio_convert_selector = OptionMenu(audio_convert_frame, audio_convert_format, 'Do not convert', *valid_audio_convert_formats.keys(), command=on_select_audio_convert_format)
-        audio_convert_selector.pack(side=TOP, fill=X, expand=True, pady=(5, 5))
+        audio_convert_selector.pack(side=LEFT, fill=X, expand=True, padx=(5, 5), pady=(5, 5))
         audio_convert_selector.configure(state=DISABLED)
         audio_convert_quality = StringVar(value='5')
         # FFmpeg uses 0 for highest quality and 10 for lowest. We want to show 10 as highest to user.
@@ -867,12 +1038,26 @@ def handle_download_info(url: str, path: str, ydl_opts: dict = None,
         # Sort keys so they appear in order 10, 9, ... 0 in the dropdown
         sorted_keys = sorted(audio_convert_quality_values.keys(), key=lambda x: int(x.split()[0]), reverse=True)
         audio_convert_quality_selector = OptionMenu(audio_convert_frame, audio_convert_quality, '5 (Medium Quality)', *sorted_keys)
-        audio_convert_quality_selector.pack(side=TOP, fill=X, expand=True, pady=(5, 5))
+        audio_convert_quality_selector.pack(side=LEFT, fill=X, expand=True, padx=(5, 5), pady=(5, 5))
         audio_convert_quality_selector.configure(state=DISABLED)
-        download_button.pack(side=TOP, fill=X, expand=True, padx=10, pady=(0, 10))  # defined at top
+        performance_frame = LabelFrame(options_frame, text='Performance', borderwidth=3)
+        performance_frame.pack(side=LEFT, fill=X, padx=(10, 0))
+        performance_profile = StringVar(value=performance_profile_var.get())
+        OptionMenu(performance_frame, performance_profile, performance_profile.get(), *PERFORMANCE_PROFILES.keys()).pack(side=TOP, fill=X, expand=True, padx=(5, 5), pady=(5, 5))
+        download_button.pack(side=TOP, fill=X, padx=10, pady=(5, 10))  # defined at top
+        download_button.configure(state=DISABLED)
+
+        tree.bind('<<TreeviewSelect>>', on_select_rows)
+        kind_selector.bind('<<ComboboxSelected>>', lambda e: populate())
+        search_var.trace_add('write', lambda *args: populate())
+        populate()
+        if not len(table): hint.set('No downloadable formats found')
         status('Ready')
 
-    threading.Thread(target=_extract_thread, daemon=True).start()
+    if ready:
+        _show_details(*prefetched.result())
+    else:
+        threading.Thread(target=_extract_thread, daemon=True).start()
 
 
 def select_save_path():
@@ -888,16 +1073,188 @@ def select_save_path():
             f.write(path)
 
 
+def get_int_setting(var: IntVar, default: int, lower: int = 1, upper: int = MAX_DOWNLOAD_WORKERS) -> int:
+    """Read an int from a Spinbox variable, falling back to default if user typed something invalid"""
+    try:
+        return max(lower, min(upper, var.get()))
+    except TclError:
+        return default
+
+
+def update_download_status():
+    active_count = download_engine.active_count
+    transcoding_count = len(download_engine.transcoding)
+    if active_count or transcoding_count:
+        status(f'Downloading {active_count} task(s), converting {transcoding_count}' if transcoding_count else f'Downloading {active_count} task(s)', log=False)
+    else:
+        status('Ready', log=False)
+
+
+def on_engine_event(task: Task, event: str):
+    if event == 'added':
+        queue_view.add(task)
+        return
+    queue_view.refresh(task)
+    if event == 'extracted':
+        queue_view.show_details(task)
+    elif event == 'extract_failed':
+        queue_view.on_done(task)
+        failed_extractions.append(task)
+        if len(failed_extractions) == 1 and not failed_extractions_dialog_open:
+            root.after(FAILED_EXTRACTIONS_DELAY_MS, report_failed_extractions)
+    elif event == 'done':
+        queue_view.on_done(task)
+    update_download_status()
+
+
+failed_extractions: list[Task] = []
+failed_extractions_dialog_open = False
+FAILED_EXTRACTIONS_DELAY_MS = 1000  # failures within this time, e.g. of a bulk import, are reported in one dialog
+
+
+def report_failed_extractions():
+    """One dialog for the extractions that failed since the last one instead of one per URL, the reasons are in their queue rows"""
+    global failed_extractions_dialog_open
+    tasks = failed_extractions[:]
+    failed_extractions.clear()
+    names = '\n'.join(t.title or t.url for t in tasks[:10]) + (f'\n... and {len(tasks) - 10} more' if len(tasks) > 10 else '')
+    failed_extractions_dialog_open = True
+    messagebox.showerror('Error', f'Extraction failed for {len(tasks)} URL(s), see the queue for details:\n\n{names}')
+    failed_extractions_dialog_open = False
+    if failed_extractions:  # failed while the dialog was open
+        root.after(FAILED_EXTRACTIONS_DELAY_MS, report_failed_extractions)
+
+
+def report_error(title: str, message: str):
+    root.after(0, lambda: messagebox.showerror(title, message))
+
+
+download_engine = Engine(call_soon=lambda func, *args: root.after(0, func, *args))
+download_engine.listeners.append(on_engine_event)
+engine.report_error = report_error
+engine.handle_login_required = handle_private_video
+
+
+def update_cache_stats():
+    cache_stats_var.set(f'Cache: {metadata_cache.hits} hits / {metadata_cache.misses} misses, '
+                        f'yt-dlp sessions: {ydl_pool.reused} reused / {ydl_pool.created} created')
+
+
+def on_toggle_remember_login():
+    if remember_login_var.get():
+        browser_cookies.remember(os.path.join(get_config_dir(), 'cookies.bin'))
+    else:
+        browser_cookies.forget()
+
+
+def restore_login():
+    """Use the browser cookies saved by a previous session, if "Remember browser login" was on"""
+    if not browser_cookies.can_save():  # the key of the saved cookies needs the OS keyring
+        remember_login_check.configure(state=DISABLED, text='Remember browser login (needs keyring)')
+        return
+    path = os.path.join(get_config_dir(), 'cookies.bin')
+    if not os.path.exists(path):
+        return
+    browser_cookies.save_path = path
+    browser = browser_cookies.load_saved()
+    if browser:
+        ydl_base_opts['cookiesfrombrowser'] = browser
+        remember_login_var.set(True)
+
+
+def on_toggle_ytdlp_cache():
+    ydl_base_opts['cachedir'] = None if use_ytdlp_cache_var.get() else False  # None -> yt-dlp's default cache dir
+
+
+def on_change_bandwidth(*args):
+    """Apply the bandwidth limit and schedule entries, marking them red while they cannot be parsed"""
+    for entry, attribute, parse in ((bandwidth_limit_entry, 'limit', parse_rate), (bandwidth_schedule_entry, 'schedule', parse_schedule)):
+        try:
+            setattr(download_engine.bandwidth, attribute, parse(entry.get()))
+            entry.configure(foreground='')
+        except ValueError as e:
+            entry.configure(foreground='red')
+            status(str(e), log=False)
+    download_engine.rebalance_bandwidth()
+
+
+def on_change_disk(*args):
+    """Apply the scratch directory and keep-free entries, marking them red while they are not valid"""
+    scratch_dir = scratch_dir_entry.get().strip()
+    if scratch_dir and not os.path.isdir(scratch_dir):
+        scratch_dir_entry.configure(foreground='red')
+        status(f'Scratch directory {scratch_dir} does not exist', log=False)
+    else:
+        scratch_dir_entry.configure(foreground='')
+        download_engine.scratch_dir = scratch_dir or None  # used by downloads started from now on
+    try:
+        download_engine.disk_headroom = parse_rate(keep_free_entry.get()) or 0
+        keep_free_entry.configure(foreground='')
+    except ValueError as e:
+        keep_free_entry.configure(foreground='red')
+        status(str(e), log=False)
+    download_engine.dispatch()  # tasks waiting for disk space may fit now
+
+
+def select_scratch_dir():
+    path = filedialog.askdirectory(initialdir=scratch_dir_entry.get() or initial_dir, title='Choose a folder for partial downloads')
+    if path:
+        scratch_dir_entry.delete(0, END)
+        scratch_dir_entry.insert(0, path)
+        on_change_disk()
+
+
+def on_toggle_preallocate():
+    download_engine.preallocate = preallocate_var.get()  # downloads admitted from now on
+
+
+def export_telemetry():
+    path = filedialog.asksaveasfilename(title='Export download stats', defaultextension='.csv', filetypes=[('CSV', '*.csv')])
+    if not path:
+        return
+    try:
+        write_telemetry_csv(download_engine.telemetry(), path)
+        status(f'Exported download stats to {path}')
+    except OSError as e:
+        messagebox.showerror('Error', f'Could not export download stats: {e}')
+
+
+metrics_server = None
+
+
+def on_toggle_metrics():
+    global metrics_server
+    if serve_metrics_var.get():
+        try:
+            metrics_server = MetricsServer(download_engine, METRICS_PORT)
+        except OSError as e:
+            serve_metrics_var.set(False)
+            messagebox.showerror('Error', f'Could not serve metrics on port {METRICS_PORT}: {e}')
+    elif metrics_server:
+        metrics_server.close()
+        metrics_server = None
+
+
+def apply_progress_updates():
+    """Single UI-thread consumer of the progress written by all download threads, at a fixed rate"""
+    queue_view.apply_pending_updates()
+    root.after(PROGRESS_REFRESH_MS, apply_progress_updates)
+
+
+def on_select_performance_profile(profile: str):
+    apply_performance_profile(ydl_base_opts, profile)
+
+
+def on_change_concurrency():
+    download_engine.max_downloads = get_int_setting(concurrent_downloads_var, 3)
+    download_engine.max_per_host = get_int_setting(per_host_downloads_var, 2)
+    download_engine.dispatch()
+
+
 def do_tasks():
-    if download_queue and not ongoing_task:
-        task = download_queue[0]
-        if not task.extracted and not task.extracting:
-            task.start_extraction()
-        elif task.extracted and task.extract_info_succeed:
-            task.start_task()
-        elif task.extracted and not task.extract_info_succeed:
-            download_queue.remove(task)
-            status('Ready')
+    on_change_concurrency()  # also picks up values typed into the spinboxes
+    download_engine.poll()
+    update_cache_stats()
     queue_frame.after(500, do_tasks)
 
 
@@ -934,14 +1291,105 @@ download_video_button.pack(expand=True, fill=X, side=LEFT, padx=(10, 0))
 download_audio_button = Button(buttons_frame, text='Download Audio', command=lambda: detect_and_handle(url_input.get(), path_input.get(), 'audio_best'))
 download_audio_button.pack(expand=True, fill=X, side=LEFT, padx=(2, 0))
 download_info_button = Button(buttons_frame, text='Customize Downloads', command=lambda: detect_and_handle(url_input.get(), path_input.get(), 'customize'))
-download_info_button.pack(expand=True, fill=X, side=LEFT, padx=(2, 10))
+download_info_button.pack(expand=True, fill=X, side=LEFT, padx=(2, 0))
+import_button = Button(buttons_frame, text='Import URLs...', command=lambda: show_bulk_import(path_input.get()))
+import_button.pack(expand=True, fill=X, side=LEFT, padx=(2, 10))
+
+settings_frame = Frame(root)
+settings_frame.pack(fill=X, side=TOP, pady=(10, 0))
+Label(settings_frame, text='Concurrent downloads: ').pack(side=LEFT, padx=(10, 0))
+concurrent_downloads_var = IntVar(value=3)
+Spinbox(settings_frame, from_=1, to=MAX_DOWNLOAD_WORKERS, textvariable=concurrent_downloads_var, width=3, command=on_change_concurrency).pack(side=LEFT)
+Label(settings_frame, text='Per site: ').pack(side=LEFT, padx=(10, 0))
+per_host_downloads_var = IntVar(value=2)
+Spinbox(settings_frame, from_=1, to=MAX_DOWNLOAD_WORKERS, textvariable=per_host_downloads_var, width=3, command=on_change_concurrency).pack(side=LEFT)
+Label(settings_frame, text='Performance: ').pack(side=LEFT, padx=(10, 0))
+performance_profile_var = StringVar(value='Standard')
+OptionMenu(settings_frame, performance_profile_var, 'Standard', *PERFORMANCE_PROFILES.keys(), command=on_select_performance_profile).pack(side=LEFT)
+remember_login_var = BooleanVar(value=False)
+remember_login_check = Checkbutton(settings_frame, text='Remember browser login (encrypted)', variable=remember_login_var, command=on_toggle_remember_login)
+remember_login_check.pack(side=RIGHT, padx=(10, 10))
+use_ytdlp_cache_var = BooleanVar(value=False)
+Checkbutton(settings_frame, text='Use yt-dlp cache (player JS, signatures)', variable=use_ytdlp_cache_var, command=on_toggle_ytdlp_cache).pack(side=LEFT, padx=(10, 0))
+
+bandwidth_frame = Frame(root)
+bandwidth_frame.pack(fill=X, side=TOP, pady=(5, 0))
+Label(bandwidth_frame, text='Bandwidth limit (e.g. 2M): ').pack(side=LEFT, padx=(10, 0))
+bandwidth_limit_entry = Entry(bandwidth_frame, width=8)
+bandwidth_limit_entry.pack(side=LEFT)
+Label(bandwidth_frame, text='Schedule (e.g. 09:00-17:00=500K, 22:00-06:00=): ').pack(side=LEFT, padx=(10, 0))
+bandwidth_schedule_entry = Entry(bandwidth_frame, width=30)
+bandwidth_schedule_entry.pack(side=LEFT, fill=X, expand=True, padx=(0, 10))
+for bandwidth_entry in (bandwidth_limit_entry, bandwidth_schedule_entry):
+    bandwidth_entry.bind('<Return>', on_change_bandwidth)
+    bandwidth_entry.bind('<FocusOut>', on_change_bandwidth)
+
+disk_frame = Frame(root)
+disk_frame.pack(fill=X, side=TOP, pady=(5, 0))
+Label(disk_frame, text='Scratch dir (partial downloads): ').pack(side=LEFT, padx=(10, 0))
+scratch_dir_entry = Entry(disk_frame, width=30)
+scratch_dir_entry.pack(side=LEFT, fill=X, expand=True)
+Button(disk_frame, text='Choose', command=select_scratch_dir).pack(side=LEFT, padx=(2, 0))
+Label(disk_frame, text='Keep free: ').pack(side=LEFT, padx=(10, 0))
+keep_free_entry = Entry(disk_frame, width=6)
+keep_free_entry.pack(side=LEFT)
+keep_free_entry.insert(0, f'{DISK_HEADROOM // 2 ** 20}M')
+for disk_entry in (scratch_dir_entry, keep_free_entry):
+    disk_entry.bind('<Return>', on_change_disk)
+    disk_entry.bind('<FocusOut>', on_change_disk)
+preallocate_var = BooleanVar(value=False)
+Checkbutton(disk_frame, text='Reserve disk space', variable=preallocate_var, command=on_toggle_preallocate).pack(side=LEFT, padx=(10, 10))
+
+telemetry_frame = Frame(root)
+telemetry_frame.pack(fill=X, side=TOP, pady=(5, 0))
+Button(telemetry_frame, text='Export Stats (CSV)...', command=export_telemetry).pack(side=LEFT, padx=(10, 0))
+serve_metrics_var = BooleanVar(value=False)
+Checkbutton(telemetry_frame, text=f'Serve Prometheus metrics at http://127.0.0.1:{METRICS_PORT}/metrics', variable=serve_metrics_var,
+            command=on_toggle_metrics).pack(side=LEFT, padx=(10, 0))
 
 scroll_container_frame = Frame(root)
 scroll_container_frame.pack(expand=True, fill=BOTH, side=TOP)
 scrollableFrame = ScrolledWindow(scroll_container_frame)
 queue_frame = LabelFrame(scrollableFrame.scrollwindow, text='Download Queue')
 queue_frame.pack(fill=BOTH, expand=True, anchor=CENTER, padx=(10, 10), pady=(10, 0))
-do_tasks()
+queue_view = QueueView(queue_frame)
+status('Loading yt-dlp...')
+root.update()  # paint the window before loading yt_dlp
+mark_startup('first paint')
+
+
+def run_selector_benchmark(num_entries: int):
+    """Print the time to build and draw the playlist selector for a synthetic playlist as JSON and exit, for benchmark.py"""
+    from benchmark import make_flat_playlist
+    playlist = make_flat_playlist(num_entries)
+    t0 = time.perf_counter()
+    show_playlist_selector(playlist, playlist['webpage_url'], initial_dir, 'video_best')
+    root.update()
+    print(json.dumps({'selector_build_ms': round((time.perf_counter() - t0) * 1000, 1), 'selector_entries': num_entries}))
+    root.destroy()
+
+
+def on_yt_dlp_loaded():
+    mark_startup('yt_dlp loaded')
+    logger.info(f'YT-DLP GUI (yt-dlp {engine.yt_dlp.version.__version__}) (Python {sys.version})')
+    logger.info(f'Startup milestones (ms): {startup_milestones}')
+    if '--selector-benchmark' in sys.argv:
+        run_selector_benchmark(int(sys.argv[sys.argv.index('--selector-benchmark') + 1]))
+        return
+    restore_login()
+    download_engine.restore()
+    do_tasks()
+    apply_progress_updates()
+    status('Ready')
+    if '--startup-benchmark' in sys.argv:  # print milestones as JSON and exit, for comparing source and frozen builds
+        print(json.dumps({'frozen': bool(frozen), **startup_milestones}))
+        root.destroy()
+
+
+def _load_yt_dlp_thread():
+    engine.load_yt_dlp()
+    root.after(0, on_yt_dlp_loaded)
+
 
-status('Ready')
+threading.Thread(target=_load_yt_dlp_thread, daemon=True).start()
 root.mainloop()